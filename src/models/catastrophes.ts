@@ -1,4 +1,4 @@
-import { List, Set } from "immutable";
+import { List, Map, Set } from "immutable";
 
 export enum CatastropheType {
     Flood = "FLOOD",
@@ -17,6 +17,10 @@ export type CatastropheFilter = Set<CatastropheType>;
 
 export const FILTER_ALL_CATASTROPHES = Set(Object.values(CatastropheType));
 
+// Up to this zoom level the map shows the precomputed clusters instead of the individual catastrophes
+// IFCHANGE: MAX_CLUSTER_ZOOM in tools/catastrophe_clusters.py
+export const MAX_CLUSTER_ZOOM = 10;
+
 export interface CatastropheLocation {
     lat: number;
     lng: number
@@ -55,6 +59,89 @@ export interface CatastropheDocument {
     loc_approx: boolean;
 }
 
+export interface CatastropheShard {
+    file: string;
+    count: number;
+    bytes: number;
+}
+
+export interface CatastropheYearShard extends CatastropheShard {
+    districts?: { [district: string]: CatastropheShard };
+    columns?: CatastropheShard;
+    clusters?: CatastropheShard;
+}
+
+// Compact per-year export: one array per attribute, types and cities are indexes in a dictionary,
+// dates are day offsets from `start` and coordinates are fixed point integers divided by `scale`
+export interface CatastropheColumns {
+    start: string;
+    scale: number;
+    types: string[];
+    cities: string[];
+    id: string[];
+    x: number[];
+    y: number[];
+    type: number[];
+    day: number[];
+    severity: Severity[];
+    district: number[];
+    loc_approx: number[];
+    city: number[];
+}
+
+// Catastrophes of a year binned on a grid of `radius` pixels for each zoom level.
+// Each row is [x, y, type index, count, mean longitude, mean latitude], x and y being the cell of the row.
+// A row holding a single catastrophe ends with the index of its document in `events`
+export interface CatastropheClusters {
+    radius: number;
+    min_zoom: number;
+    max_zoom: number;
+    types: string[];
+    zooms: { [zoom: string]: [number, number, number, number, number, number, number?][] };
+    events?: CatastropheDocument[];
+}
+
+export interface CatastropheCluster extends MapObject {
+    count: number;
+    zoom: number;
+    event?: CatastropheDocument;
+}
+
+// Index of the per-year files written by tools/generate_catastrophes.py
+export interface CatastropheManifest {
+    version: number;
+    revision?: number;
+    total: number;
+    years: { [year: string]: CatastropheYearShard };
+}
+
+// Number of catastrophes per year, district (0 for the whole province) and type, as a list indexed by severity
+export interface CatastropheCounts {
+    version: number;
+    years: { [year: string]: { [district: string]: { [type: string]: number[] } } };
+}
+
+// Identifies a document from one revision to the next
+export interface CatastropheKey {
+    id: string;
+    type: string;
+    date: string;
+}
+
+// Changes between two consecutive revisions: documents to remove, then documents to add
+export interface CatastropheDelta {
+    from: number;
+    to: number;
+    added: CatastropheDocument[];
+    removed: CatastropheKey[];
+}
+
+// Latest revision and the deltas still published to reach it
+export interface CatastropheRevision {
+    revision: number;
+    deltas: { [revision: string]: string };
+}
+
 export function parseCatatrophe(doc: CatastropheDocument): Catastrophe {
     return {
         id: doc.id,
@@ -68,6 +155,43 @@ export function parseCatatrophe(doc: CatastropheDocument): Catastrophe {
     };
 }
 
+export function parseCatastropheColumns(columns: CatastropheColumns): Catastrophe[] {
+    const start = new Date(columns.start).getTime();
+    const catastrophes: Catastrophe[] = new Array(columns.id.length);
+    for (let i = 0; i < columns.id.length; ++i) {
+        catastrophes[i] = {
+            id: columns.id[i],
+            location: { lat: columns.y[i] / columns.scale, lng: columns.x[i] / columns.scale },
+            // -1 (no city) decodes to undefined, like a missing key in the JSON documents
+            city: columns.cities[columns.city[i]],
+            type: columns.types[columns.type[i]] as CatastropheType,
+            date: new Date(start + columns.day[i] * 86400000),
+            severity: columns.severity[i],
+            district: columns.district[i],
+            loc_approx: columns.loc_approx[i] !== 0
+        };
+    }
+    return catastrophes;
+}
+
+function catastropheKey(catastrophe: Catastrophe) {
+    return `${catastrophe.id}/${catastrophe.type}/${catastrophe.date.toISOString().substring(0, 10)}`;
+}
+
+// Only the years already loaded are patched, other years are read from the current files when needed.
+// Applying a delta twice gives the same result.
+export function applyCatastropheDelta(catastrophes: Map<number, List<Catastrophe>>, delta: CatastropheDelta): Map<number, List<Catastrophe>> {
+    const keys = Set<string>(delta.removed.concat(delta.added).map(x => `${x.id}/${x.type}/${x.date}`));
+    let result = catastrophes.map(x => x.filter(catastrophe => !keys.has(catastropheKey(catastrophe))));
+    for (const catastrophe of delta.added.map(parseCatatrophe)) {
+        const year = catastrophe.date.getUTCFullYear();
+        if (result.has(year)) {
+            result = result.update(year, x => x!.push(catastrophe));
+        }
+    }
+    return result.map(x => x.sortBy(catastrophe => catastrophe.date.getTime()));
+}
+
 export interface CatastropheGroup {
     id: string;
     location: CatastropheLocation;
@@ -88,9 +212,13 @@ function mergeTypes(catastrophes: List<Catastrophe>) {
     return first;
 }
 
+function locationKey(location: CatastropheLocation) {
+    return `${location.lat.toFixed(4)}/${location.lng.toFixed(4)}`;
+}
+
 export function groupCatastrophes(catastrophes: List<Catastrophe>) {
     return catastrophes
-        .groupBy(x => `${x.location.lat.toFixed(4)}/${x.location.lng.toFixed(4)}`)
+        .groupBy(x => locationKey(x.location))
         .map((x, k) => {
             const instances = x.toList();
             const first = instances.get(0)!;
@@ -106,3 +234,53 @@ export function groupCatastrophes(catastrophes: List<Catastrophe>) {
             return group;
         }).toList();
 }
+
+// Merges the rows of the filtered types falling in the same cell. Zoom levels outside of the precomputed ones
+// use the closest level.
+export function findClusters(clusters: CatastropheClusters, zoom: number, filter: CatastropheFilter): List<CatastropheCluster> {
+    const level = Math.min(Math.max(Math.floor(zoom), clusters.min_zoom), clusters.max_zoom);
+    const cells: { [key: string]: { count: number, lng: number, lat: number, type: CatastropheType, event?: number } } = {};
+    for (const [x, y, typeIndex, count, lng, lat, event] of clusters.zooms[level.toString()] ?? []) {
+        const type = clusters.types[typeIndex] as CatastropheType;
+        if (!filter.includes(type)) {
+            continue;
+        }
+        const key = `${x}/${y}`;
+        const cell = cells[key];
+        if (cell) {
+            cell.count += count;
+            cell.lng += lng * count;
+            cell.lat += lat * count;
+            if (cell.type !== type) {
+                cell.type = CatastropheType.Unknown;
+            }
+        } else {
+            cells[key] = { count, lng: lng * count, lat: lat * count, type, event };
+        }
+    }
+    return List(Object.entries(cells).map(([key, cell]) => {
+        const cluster: CatastropheCluster = {
+            // Markers are replaced when the zoom level, the content or the filter changes
+            id: `${level}/${key}/${cell.type}/${cell.count}`,
+            location: { lat: cell.lat / cell.count, lng: cell.lng / cell.count },
+            type: cell.type,
+            count: cell.count,
+            zoom: level
+        };
+        // The document is only kept while the cell holds a single catastrophe
+        const event = cell.count === 1 && cell.event !== undefined ? clusters.events?.[cell.event] : undefined;
+        if (event) {
+            cluster.event = event;
+        }
+        return cluster;
+    }));
+}
+
+export function isCluster(item: MapObject): item is CatastropheCluster {
+    return 'count' in item;
+}
+
+// A cluster of a single catastrophe is replaced by the catastrophe itself, so that its details can be shown
+export function expandSingleClusters(clusters: List<CatastropheCluster>): List<CatastropheCluster | CatastropheGroup> {
+    return clusters.map(cluster => cluster.event ? groupCatastrophes(List([parseCatatrophe(cluster.event)])).first()! : cluster);
+}
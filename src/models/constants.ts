@@ -3,6 +3,9 @@ import { Range } from 'immutable';
 export const REFERENCE_YEAR = 1990;  // For delta temperatures
 export const CURRENT_YEAR = new Date().getFullYear();
 
+// How often open pages check for newly published catastrophes
+export const CATASTROPHE_REFRESH_INTERVAL = 15 * 60 * 1000;
+
 // For these years, we have historical data.
 export const MIN_HISTORICAL_YEAR = REFERENCE_YEAR;
 export const MAX_HISTORICAL_YEAR = 2013;
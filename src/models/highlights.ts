@@ -4,6 +4,6 @@ export interface Highlight extends MapObject {
     year: number;
     locale: string;
     title?: string;
-    body: string;
+    // Pre-rendered HTML body, relative to public/data, loaded when the highlight is opened
+    file: string;
 }
-
@@ -8,4 +8,15 @@ export interface DistrictProperties {
 
 // District names are in French, so always sort them using French rules
 const collator = new Intl.Collator('fr', { sensitivity: 'base' });
-export const allDistricts = List(Object.entries(data).map(([k, v]) => ({ id: parseInt(k, 10), name: v })).sort((a, b) => collator.compare(a.name, b.name)));
\ No newline at end of file
+export const allDistricts = List(Object.entries(data).map(([k, v]) => ({ id: parseInt(k, 10), name: v })).sort((a, b) => collator.compare(a.name, b.name)));
+// Simplification levels of the district map, see tools/update_map.py
+export interface MapLevel {
+    name: string;
+    min_zoom: number;
+    max_zoom: number | null;
+    file: string;
+}
+
+export function findMapLevel(levels: MapLevel[], zoom: number): MapLevel | undefined {
+    return levels.find(x => zoom >= x.min_zoom && (x.max_zoom === null || zoom <= x.max_zoom)) ?? levels[levels.length - 1];
+}
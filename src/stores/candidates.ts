@@ -1,4 +1,5 @@
 import { Candidate } from "@/models/candidates";
+import { dataUrl } from "@/utils/data_files";
 import axios from "axios";
 import { List } from "immutable";
 import { defineStore } from "pinia";
@@ -16,7 +17,7 @@ export const useCandidateStore = defineStore('candidateStore', {
     },
     actions: {
         async loadCandidates() {
-            const response = await axios.get<Candidate[]>('data/candidates.json');
+            const response = await axios.get<Candidate[]>(await dataUrl('candidates.json'));
             this.candidates = List(response.data);
         }
     }
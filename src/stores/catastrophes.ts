@@ -1,6 +1,7 @@
-import { Catastrophe, CatastropheDocument, CatastropheFilter, parseCatatrophe } from "@/models/catastrophes";
+import { applyCatastropheDelta, Catastrophe, CatastropheCluster, CatastropheClusters, CatastropheColumns, CatastropheCounts, CatastropheDelta, CatastropheDocument, CatastropheFilter, CatastropheManifest, CatastropheRevision, CatastropheType, findClusters, MAX_CLUSTER_ZOOM, parseCatastropheColumns, parseCatatrophe } from "@/models/catastrophes";
+import { dataUrl, loadDataManifest } from "@/utils/data_files";
 import axios from "axios";
-import { List, Map } from "immutable";
+import { List, Map, Set } from "immutable";
 import { defineStore } from "pinia";
 
 function filterCatastrophe(catastrophe: Catastrophe, district: number, filter: CatastropheFilter) {
@@ -16,7 +17,14 @@ function filterCatastrophe(catastrophe: Catastrophe, district: number, filter: C
 export const useCatastropheStore = defineStore('catastropheStore', {
     state: () => {
         return {
-            catastrophes: Map<number, List<Catastrophe>>()
+            catastrophes: Map<number, List<Catastrophe>>(),
+            manifest: undefined as CatastropheManifest | undefined,
+            counts: undefined as CatastropheCounts | undefined,
+            // Revision of the loaded catastrophes
+            revision: undefined as number | undefined,
+            requestedYears: Set<number>(),
+            clusters: Map<number, CatastropheClusters>(),
+            requestedClusters: Set<number>()
         };
     },
     getters: {
@@ -27,20 +35,107 @@ export const useCatastropheStore = defineStore('catastropheStore', {
             }
             return List();
         },
-        countCatastrophes: state => (year: number, district: number, filter: CatastropheFilter): number => {
-            const catastrophes = state.catastrophes.get(year);
-            if (catastrophes) {
-                return catastrophes.count(x => filterCatastrophe(x, district, filter));
+        // Files published before the clusters were added only have the individual catastrophes
+        useClusters: state => (year: number, zoom: number): boolean => {
+            return zoom <= MAX_CLUSTER_ZOOM && state.manifest?.years[year.toString()]?.clusters !== undefined;
+        },
+        findClusters: state => (year: number, zoom: number, filter: CatastropheFilter): List<CatastropheCluster> => {
+            const clusters = state.clusters.get(year);
+            if (clusters) {
+                return findClusters(clusters, zoom, filter);
             }
-            return 0;
+            return List();
+        },
+        countCatastrophesByType: state => (year: number, district: number): Map<CatastropheType, number> => {
+            const counts = state.counts?.years[year.toString()]?.[district.toString()] ?? {};
+            return Map(Object.entries(counts).map(([type, severities]) => [type as CatastropheType, severities.reduce((a, b) => a + b, 0)]));
+        },
+        countCatastrophes(): (year: number, district: number, filter: CatastropheFilter) => number {
+            return (year, district, filter) => this.countCatastrophesByType(year, district)
+                .filter((_, type) => filter.includes(type))
+                .reduce((a, b) => a + b, 0);
         },
     },
     actions: {
         async loadCatastrophes() {
-            const response = await axios.get<{ [year: string]: CatastropheDocument[] }>(`data/catastrophes.json`);
-            for (const [year, docs] of Object.entries(response.data)) {
-                const catastrophes = docs.map(parseCatatrophe);
-                this.catastrophes = this.catastrophes.set(parseInt(year, 10), List(catastrophes));
+            const response = await axios.get<CatastropheManifest>(await dataUrl("catastrophes/manifest.json"));
+            this.manifest = response.data;
+            if (this.revision === undefined) {
+                this.revision = response.data.revision;
+            }
+        },
+        async loadCounts() {
+            const response = await axios.get<CatastropheCounts>(await dataUrl("catastrophes/counts.json"));
+            this.counts = response.data;
+        },
+        async refreshCatastrophes() {
+            // The pointer and the deltas are published under fixed names, the pointer is never cached
+            const latest = (await axios.get<CatastropheRevision>("data/catastrophes/latest.json")).data;
+            const current = this.revision;
+            if (current === undefined || latest.revision <= current) {
+                return;
+            }
+            const revisions = Array.from({ length: latest.revision - current }, (_, i) => (current + i + 1).toString());
+            if (revisions.every(x => latest.deltas[x])) {
+                const deltas = await Promise.all(revisions.map(x => axios.get<CatastropheDelta>(`data/${latest.deltas[x]}`)));
+                let catastrophes = this.catastrophes;
+                for (const delta of deltas) {
+                    catastrophes = applyCatastropheDelta(catastrophes, delta.data);
+                }
+                this.catastrophes = catastrophes;
+                this.revision = latest.revision;
+                // Years loaded later must come from the new files
+                await loadDataManifest(true);
+                await Promise.all([this.loadCatastrophes(), this.loadCounts()]);
+                await this.reloadClusters();
+            } else {
+                // Too far behind: the loaded years are fetched again
+                const years = this.requestedYears.toArray();
+                this.revision = undefined;
+                await loadDataManifest(true);
+                await Promise.all([this.loadCatastrophes(), this.loadCounts()]);
+                this.catastrophes = Map();
+                this.requestedYears = Set();
+                await Promise.all(years.map(x => this.loadYear(x)));
+                await this.reloadClusters();
+            }
+        },
+        async reloadClusters() {
+            const years = this.requestedClusters.toArray();
+            this.requestedClusters = Set();
+            await Promise.all(years.map(x => this.loadClusters(x)));
+        },
+        async loadClusters(year: number) {
+            const shard = this.manifest?.years[year.toString()]?.clusters;
+            if (!shard || this.requestedClusters.has(year)) {
+                return;
+            }
+            this.requestedClusters = this.requestedClusters.add(year);
+            try {
+                const response = await axios.get<CatastropheClusters>(await dataUrl(shard.file));
+                this.clusters = this.clusters.set(year, response.data);
+            } catch (e) {
+                this.requestedClusters = this.requestedClusters.delete(year);
+                throw e;
+            }
+        },
+        async loadYear(year: number) {
+            const shard = this.manifest?.years[year.toString()];
+            if (!shard || this.requestedYears.has(year)) {
+                return;
+            }
+            this.requestedYears = this.requestedYears.add(year);
+            try {
+                if (shard.columns) {
+                    const response = await axios.get<CatastropheColumns>(await dataUrl(shard.columns.file));
+                    this.catastrophes = this.catastrophes.set(year, List(parseCatastropheColumns(response.data)));
+                } else {
+                    const response = await axios.get<CatastropheDocument[]>(await dataUrl(shard.file));
+                    this.catastrophes = this.catastrophes.set(year, List(response.data.map(parseCatatrophe)));
+                }
+            } catch (e) {
+                this.requestedYears = this.requestedYears.delete(year);
+                throw e;
             }
         }
     }
@@ -1,26 +1,49 @@
 import { Highlight } from "@/models/highlights";
+import { dataUrl } from "@/utils/data_files";
 import axios from "axios";
-import { List } from "immutable";
+import { List, Map, Set } from "immutable";
 import { defineStore } from "pinia";
 
 export const useHighlightStore = defineStore('highlightStore', {
     state: () => {
         return {
-            highlights: List<Highlight>()
+            highlights: List<Highlight>(),
+            requestedLocales: Set<string>(),
+            // HTML bodies by file
+            bodies: Map<string, string>()
         };
     },
     getters: {
         findHighlights: state => (year: number, locale: string) => {
-            return state.highlights.filter(x => x.year === year && locale === locale);
+            return state.highlights.filter(x => x.year === year && x.locale === locale);
         },
         getYearsWithHighlights: state => (locale: string) => {
             return state.highlights.filter(x => x.locale === locale).map(x => x.year).toSet();
+        },
+        findBody: state => (highlight: Highlight): string | undefined => {
+            return state.bodies.get(highlight.file);
         }
     },
     actions: {
-        async loadHighlights() {
-            const response = await axios.get<Highlight[]>(`data/highlights.json`);
-            this.highlights = List(response.data);
+        async loadHighlights(locale: string) {
+            if (this.requestedLocales.has(locale)) {
+                return;
+            }
+            this.requestedLocales = this.requestedLocales.add(locale);
+            try {
+                const response = await axios.get<Highlight[]>(await dataUrl(`highlights/${locale}.json`));
+                this.highlights = this.highlights.concat(response.data);
+            } catch (e) {
+                this.requestedLocales = this.requestedLocales.delete(locale);
+                throw e;
+            }
+        },
+        async loadBody(highlight: Highlight) {
+            if (this.bodies.has(highlight.file)) {
+                return;
+            }
+            const response = await axios.get<string>(await dataUrl(highlight.file), { responseType: "text" });
+            this.bodies = this.bodies.set(highlight.file, response.data);
         }
     }
 })
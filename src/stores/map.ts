@@ -1,4 +1,6 @@
-import { DistrictProperties } from "@/models/map";
+import { DistrictProperties, findMapLevel, MapLevel } from "@/models/map";
+import { decodeArcs, decodeFeatures, decodeGeometry, Topology, TopologyGeometry } from "@/utils/topology";
+import { dataUrl } from "@/utils/data_files";
 import axios from "axios";
 import { FeatureCollection, Geometry, Polygon } from "geojson";
 import { defineStore } from "pinia";
@@ -7,17 +9,42 @@ export const useMapStore = defineStore('Map', {
     state: () => {
         return {
             districts: undefined as FeatureCollection<Geometry, DistrictProperties> | undefined,
-            mask: undefined as Polygon | undefined
+            mask: undefined as Polygon | undefined,
+            levels: [] as MapLevel[],
+            level: undefined as string | undefined,
+            zoom: undefined as number | undefined
         }
     },
     actions: {
         async loadMap() {
-            const [districtResponse, maskResponse] = await Promise.all([
-                axios.get<FeatureCollection<Geometry, DistrictProperties>>("data/carte_electorale.json", { responseType: "json" }),
-                axios.get<Polygon>("data/masque_electoral.json", { responseType: "json" })
-            ]);
-            this.districts = districtResponse.data;
-            this.mask = maskResponse.data;
+            const response = await axios.get<MapLevel[]>(await dataUrl("carte_electorale_niveaux.json"), { responseType: "json" });
+            this.levels = response.data;
+            // Start with the coarsest level unless the map already reported its zoom, finer levels are loaded on demand
+            await this.loadMapForZoom(this.zoom ?? this.levels[0].min_zoom);
+        },
+        async loadMapForZoom(zoom: number) {
+            this.zoom = zoom;
+            const level = findMapLevel(this.levels, zoom);
+            if (!level || level.name === this.level) {
+                return;
+            }
+            this.level = level.name;
+            let response;
+            try {
+                response = await axios.get<Topology>(await dataUrl(level.file), { responseType: "json" });
+            } catch (e) {
+                // Fetched again on the next zoom change, unless another level was requested in the meantime
+                if (this.level === level.name) {
+                    this.level = undefined;
+                }
+                throw e;
+            }
+            if (this.level !== level.name) {
+                return; // Another level was requested in the meantime
+            }
+            const arcs = decodeArcs(response.data);
+            this.districts = decodeFeatures<DistrictProperties>(response.data, "districts", arcs);
+            this.mask = decodeGeometry(arcs, response.data.objects.mask as TopologyGeometry<unknown>) as Polygon;
         }
     }
-});
\ No newline at end of file
+});
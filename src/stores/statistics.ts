@@ -3,6 +3,7 @@ import { Map } from "immutable";
 import { defineStore } from "pinia";
 import { parseYearlyStatistics, RegionStatistics, YearlyStatistics, YearlyStatisticsDocument } from "@/models/yearly_data";
 import { findRegionByDistrict } from "@/models/regions";
+import { dataUrl } from "@/utils/data_files";
 
 export function getStatisticsForRegion(stats: YearlyStatistics, district: number) {
     let statistics = stats.get(district); // first off, search by district
@@ -49,7 +50,7 @@ export const useStatisticStore = defineStore('statisticStore', {
             const response = await axios.get<{
                 statistics: { [year: string]: YearlyStatisticsDocument },
                 over_target: { [id: string]: number }
-            }>(`data/statistics.json`);
+            }>(await dataUrl("statistics.json"));
 
             for (const [year, doc] of Object.entries(response.data.statistics)) {
                 const statistics = parseYearlyStatistics(doc);
@@ -0,0 +1,26 @@
+import axios from "axios";
+
+// Index of the content-hashed copies written by tools/publish_data.py
+export interface DataManifest {
+    version: number;
+    files: { [file: string]: { file: string; bytes: number } };
+}
+
+let manifest: Promise<DataManifest | undefined> | undefined;
+
+export function loadDataManifest(refresh = false): Promise<DataManifest | undefined> {
+    if (!manifest || refresh) {
+        // Without a manifest (e.g. data regenerated locally without publishing), the plain files are used
+        manifest = axios.get<DataManifest>("data/manifest.json", { responseType: "json" })
+            .then(response => response.data, () => undefined);
+    }
+    return manifest;
+}
+
+export function resolveDataFile(manifest: DataManifest | undefined, file: string): string {
+    return `data/${manifest?.files[file]?.file ?? file}`;
+}
+
+export async function dataUrl(file: string): Promise<string> {
+    return resolveDataFile(await loadDataManifest(), file);
+}
@@ -1,6 +1,6 @@
 import L from "leaflet";
 
-import { CatastropheGroup, CatastropheType } from "@/models/catastrophes";
+import { CatastropheCluster, CatastropheGroup, CatastropheType } from "@/models/catastrophes";
 import { TEMPERATURE_THEME } from "./colours";
 import { Feature, Geometry } from "geojson";
 import { DistrictProperties } from "@/models/map";
@@ -120,6 +120,19 @@ export function createMapMarker(group: CatastropheGroup, appContext: AppContext)
     return createMarkerInternal(group.location, group.type, catastropheIcons, 0, appContext, () => h(CatastropheDetails, { group }));
 }
 
+export function createClusterMarker(cluster: CatastropheCluster) {
+    const icon = L.divIcon({
+        iconSize: null as any,
+        className: `map-icon catastrophe-icon-${cluster.type.toLowerCase()}`,
+        html: cluster.count > 1 ? `<span class="cluster-count">${cluster.count}</span>` : ''
+    });
+    return L.marker(cluster.location, {
+        icon,
+        opacity: 1,
+        title: cluster.count.toString()
+    });
+}
+
 export function createHighlightMarker(highlight: Highlight, appContext: AppContext) {
     return createMarkerInternal(highlight.location, highlight.type, highlightIcons, 100, appContext, () => h(HighlightView, { highlight }));
 }
@@ -0,0 +1,77 @@
+import { Feature, FeatureCollection, Geometry, MultiPolygon, Polygon, Position } from "geojson";
+
+// Minimal TopoJSON decoder for the quantized, delta-encoded files produced by tools/update_map.py
+
+export interface TopologyGeometry<P> {
+    type: "Polygon" | "MultiPolygon" | null;
+    arcs?: number[][] | number[][][];
+    properties: P;
+}
+
+export interface TopologyGeometryCollection<P> {
+    type: "GeometryCollection";
+    geometries: TopologyGeometry<P>[];
+}
+
+export interface Topology {
+    type: "Topology";
+    bbox: number[];
+    transform: {
+        scale: [number, number];
+        translate: [number, number];
+    };
+    objects: { [name: string]: TopologyGeometryCollection<any> | TopologyGeometry<any> };
+    arcs: number[][][];
+}
+
+export function decodeArcs(topology: Topology): Position[][] {
+    const [sx, sy] = topology.transform.scale;
+    const [tx, ty] = topology.transform.translate;
+    return topology.arcs.map(arc => {
+        let x = 0;
+        let y = 0;
+        return arc.map(([dx, dy]) => {
+            x += dx;
+            y += dy;
+            return [x * sx + tx, y * sy + ty];
+        });
+    });
+}
+
+function decodeRing(arcs: Position[][], ring: number[]): Position[] {
+    const points: Position[] = [];
+    for (const index of ring) {
+        const arc = index >= 0 ? arcs[index] : arcs[~index].slice().reverse();
+        // Consecutive arcs share their junction point
+        points.push(...(points.length ? arc.slice(1) : arc));
+    }
+    return points;
+}
+
+export function decodeGeometry(arcs: Position[][], geometry: TopologyGeometry<unknown>): Polygon | MultiPolygon | null {
+    switch (geometry.type) {
+        case "Polygon":
+            return {
+                type: "Polygon",
+                coordinates: (geometry.arcs as number[][]).map(ring => decodeRing(arcs, ring))
+            };
+        case "MultiPolygon":
+            return {
+                type: "MultiPolygon",
+                coordinates: (geometry.arcs as number[][][]).map(polygon => polygon.map(ring => decodeRing(arcs, ring)))
+            };
+    }
+    return null;
+}
+
+export function decodeFeatures<P>(topology: Topology, name: string, arcs: Position[][] = decodeArcs(topology)): FeatureCollection<Geometry, P> {
+    const collection = topology.objects[name] as TopologyGeometryCollection<P>;
+    const features: Feature<Geometry, P>[] = [];
+    for (const geometry of collection.geometries) {
+        const decoded = decodeGeometry(arcs, geometry);
+        if (decoded) {
+            features.push({ type: "Feature", properties: geometry.properties, geometry: decoded });
+        }
+    }
+    return { type: "FeatureCollection", features };
+}
@@ -0,0 +1,115 @@
+import { describe, expect, it } from 'vitest'
+import { List, Map, Set } from 'immutable';
+import { applyCatastropheDelta, CatastropheClusters, CatastropheColumns, CatastropheDelta, CatastropheDocument, CatastropheGroup, CatastropheType, expandSingleClusters, findClusters, parseCatastropheColumns, parseCatatrophe } from '../../src/models/catastrophes';
+
+describe('Catastrophe columns', () => {
+  const columns: CatastropheColumns = {
+    start: '2021-01-01',
+    scale: 1000000,
+    types: ['FLOOD', 'HEAT_WAVE'],
+    cities: ['Gatineau'],
+    id: ['12', '7024745_20210607'],
+    x: [-75701270, -73750000],
+    y: [45476543, 45470000],
+    type: [0, 1],
+    day: [31, 157],
+    severity: [3, 4],
+    district: [45, 0],
+    loc_approx: [0, 1],
+    city: [0, -1]
+  };
+
+  it('should decode the same catastrophes as the JSON documents', () => {
+    const catastrophes = parseCatastropheColumns(columns);
+    expect(catastrophes).to.eql([
+      parseCatatrophe({
+        id: '12', location: [-75.70127, 45.476543], city: 'Gatineau', type: 'FLOOD',
+        date: '2021-02-01', severity: 3, district: 45, loc_approx: false
+      }),
+      parseCatatrophe({
+        id: '7024745_20210607', location: [-73.75, 45.47], city: undefined!, type: 'HEAT_WAVE',
+        date: '2021-06-07', severity: 4, district: 0, loc_approx: true
+      })
+    ]);
+    expect(catastrophes[1].type).to.equal(CatastropheType.HeatWave);
+  });
+});
+
+describe('Catastrophe deltas', () => {
+  const document = (id: string, date: string, severity = 3): CatastropheDocument => ({
+    id, location: [-73.5, 45.5], city: 'Montréal', type: 'FLOOD', date, severity, district: 1, loc_approx: false
+  });
+  const catastrophes = Map([
+    [2021, List([document('1', '2021-03-01'), document('2', '2021-05-01')].map(parseCatatrophe))],
+    [2022, List([document('3', '2022-01-01')].map(parseCatatrophe))]
+  ]);
+  const delta: CatastropheDelta = {
+    from: 1,
+    to: 2,
+    added: [document('4', '2021-04-01'), document('2', '2021-05-01', 4), document('5', '2019-01-01')],
+    removed: [{ id: '2', type: 'FLOOD', date: '2021-05-01' }, { id: '3', type: 'FLOOD', date: '2022-01-01' }]
+  };
+
+  it('should patch the loaded years', () => {
+    const result = applyCatastropheDelta(catastrophes, delta);
+    expect(result.get(2021)!.map(x => [x.id, x.severity]).toArray()).to.eql([['1', 3], ['4', 3], ['2', 4]]);
+    expect(result.get(2022)!.size).to.equal(0);
+    // Years not loaded are left to be fetched from the new files
+    expect(result.has(2019)).to.equal(false);
+  });
+
+  it('should be idempotent', () => {
+    const once = applyCatastropheDelta(catastrophes, delta);
+    expect(applyCatastropheDelta(once, delta).toJS()).to.eql(once.toJS());
+  });
+});
+
+describe('Catastrophe clusters', () => {
+  const clusters: CatastropheClusters = {
+    radius: 64,
+    min_zoom: 5,
+    max_zoom: 6,
+    types: ['FLOOD', 'HEAT_WAVE'],
+    zooms: {
+      '5': [[10, 20, 0, 3, -73, 46], [10, 20, 1, 1, -75, 46, 0], [11, 20, 1, 2, -70, 48]],
+      '6': [[20, 40, 0, 3, -73, 46], [21, 40, 1, 1, -75, 46, 0], [22, 41, 1, 2, -70, 48]]
+    },
+    events: [{
+      id: '1', location: [-75, 46], city: 'Cornwall', type: 'HEAT_WAVE',
+      date: '2022-07-01', severity: 1, district: 1, loc_approx: false
+    }]
+  };
+
+  it('should merge the types of a cell', () => {
+    const found = findClusters(clusters, 5, Set([CatastropheType.Flood, CatastropheType.HeatWave]));
+    expect(found.toArray()).to.eql([
+      { id: '5/10/20/UNKNOWN/4', location: { lat: 46, lng: -73.5 }, type: CatastropheType.Unknown, count: 4, zoom: 5 },
+      { id: '5/11/20/HEAT_WAVE/2', location: { lat: 48, lng: -70 }, type: CatastropheType.HeatWave, count: 2, zoom: 5 }
+    ]);
+  });
+
+  it('should only count the filtered types', () => {
+    const found = findClusters(clusters, 5, Set([CatastropheType.Flood]));
+    expect(found.map(x => [x.type, x.count]).toArray()).to.eql([[CatastropheType.Flood, 3]]);
+  });
+
+  it('should use the closest precomputed zoom level', () => {
+    expect(findClusters(clusters, 4, Set([CatastropheType.HeatWave])).map(x => x.zoom).toArray()).to.eql([5, 5]);
+    expect(findClusters(clusters, 9, Set([CatastropheType.HeatWave])).map(x => x.zoom).toArray()).to.eql([6, 6]);
+  });
+
+  it('should replace the clusters of a single catastrophe by the catastrophe', () => {
+    const found = findClusters(clusters, 5, Set([CatastropheType.HeatWave]));
+    expect(found.get(0)!.event).to.equal(clusters.events![0]);
+    expect(found.get(1)!.event).to.be.undefined;
+
+    const expanded = expandSingleClusters(found);
+    expect(expanded.map(x => x.id).toArray()).to.eql(['46.0000/-75.0000', '5/11/20/HEAT_WAVE/2']);
+    expect((expanded.get(0) as CatastropheGroup).instances.toArray()).to.eql([parseCatatrophe(clusters.events![0])]);
+  });
+
+  it('should not keep the document of a merged cell', () => {
+    const found = findClusters(clusters, 5, Set([CatastropheType.Flood, CatastropheType.HeatWave]));
+    expect(expandSingleClusters(found).toArray()).to.eql(found.toArray());
+  });
+});
@@ -0,0 +1,31 @@
+import { createPinia, setActivePinia } from 'pinia';
+import { beforeEach, describe, expect, it } from 'vitest'
+import { Set } from 'immutable';
+import { useCatastropheStore } from '../../src/stores/catastrophes';
+import { CatastropheType, FILTER_ALL_CATASTROPHES } from '../../src/models/catastrophes';
+
+describe('Catastrophe Store', () => {
+  beforeEach(() => {
+    setActivePinia(createPinia());
+  });
+
+  it('should count catastrophes from the precomputed counts', () => {
+    const store = useCatastropheStore();
+    store.counts = {
+      version: 1,
+      years: {
+        '2021': {
+          '0': { FLOOD: [0, 0, 0, 5, 2], HEAT_WAVE: [0, 0, 0, 1, 0] },
+          '45': { FLOOD: [0, 0, 0, 2, 1] }
+        }
+      }
+    };
+
+    expect(store.countCatastrophes(2021, 0, FILTER_ALL_CATASTROPHES)).to.equal(8);
+    expect(store.countCatastrophes(2021, 0, Set([CatastropheType.HeatWave]))).to.equal(1);
+    expect(store.countCatastrophes(2021, 45, FILTER_ALL_CATASTROPHES)).to.equal(3);
+    expect(store.countCatastrophes(2021, 12, FILTER_ALL_CATASTROPHES)).to.equal(0);
+    expect(store.countCatastrophes(1990, 0, FILTER_ALL_CATASTROPHES)).to.equal(0);
+    expect(store.countCatastrophesByType(2021, 0).get(CatastropheType.Flood)).to.equal(7);
+  });
+});
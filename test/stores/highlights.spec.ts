@@ -0,0 +1,48 @@
+import { createPinia, setActivePinia } from 'pinia';
+import { beforeEach, describe, expect, it } from 'vitest'
+import { List, Map } from 'immutable';
+import { useHighlightStore } from '../../src/stores/highlights';
+import { Highlight } from '../../src/models/highlights';
+import { CatastropheType } from '../../src/models/catastrophes';
+
+describe('Highlight Store', () => {
+  beforeEach(() => {
+    setActivePinia(createPinia());
+  });
+
+  const highlights: Highlight[] = [
+    {
+      id: 'crise_du_verglas',
+      year: 1998,
+      locale: 'fr-CA',
+      type: CatastropheType.FreezingRain,
+      location: { lat: 45.59, lng: -73.02 },
+      file: 'highlights/fr-CA/crise_du_verglas.html'
+    },
+    {
+      id: 'ice_storm',
+      year: 1998,
+      locale: 'en-CA',
+      type: CatastropheType.FreezingRain,
+      location: { lat: 45.59, lng: -73.02 },
+      file: 'highlights/en-CA/ice_storm.html'
+    }
+  ];
+
+  it('should only return the highlights of the locale', () => {
+    const store = useHighlightStore();
+    store.highlights = List(highlights);
+
+    expect(store.findHighlights(1998, 'fr-CA').toArray()).to.eql(highlights.slice(0, 1));
+    expect(store.findHighlights(1999, 'fr-CA').size).to.equal(0);
+    expect(store.getYearsWithHighlights('en-CA').toArray()).to.eql([1998]);
+  });
+
+  it('should return the loaded bodies', () => {
+    const store = useHighlightStore();
+    store.bodies = Map([[highlights[0].file, '<p>Durée de <strong>34 jours</strong></p>']]);
+
+    expect(store.findBody(highlights[0])).to.equal('<p>Durée de <strong>34 jours</strong></p>');
+    expect(store.findBody(highlights[1])).to.be.undefined;
+  });
+});
@@ -0,0 +1,22 @@
+import { describe, expect, it } from 'vitest'
+import { DataManifest, resolveDataFile } from '../../src/utils/data_files';
+
+describe('Data files', () => {
+  const manifest: DataManifest = {
+    version: 1,
+    files: {
+      'candidates.json': { file: 'v/candidates.0123456789ab.json', bytes: 42 },
+      'catastrophes/1990.json': { file: 'v/catastrophes/1990.ba9876543210.json', bytes: 12 }
+    }
+  };
+
+  it('should resolve published files to their hashed copy', () => {
+    expect(resolveDataFile(manifest, 'candidates.json')).to.equal('data/v/candidates.0123456789ab.json');
+    expect(resolveDataFile(manifest, 'catastrophes/1990.json')).to.equal('data/v/catastrophes/1990.ba9876543210.json');
+  });
+
+  it('should fall back to the plain file', () => {
+    expect(resolveDataFile(manifest, 'statistics.json')).to.equal('data/statistics.json');
+    expect(resolveDataFile(undefined, 'candidates.json')).to.equal('data/candidates.json');
+  });
+});
@@ -0,0 +1,42 @@
+import { describe, expect, it } from 'vitest'
+import { decodeFeatures, decodeGeometry, decodeArcs, Topology } from '../../src/utils/topology';
+
+describe('Topology decoder', () => {
+  // Two unit squares sharing their middle edge (arc 0), stored once
+  const topology: Topology = {
+    type: 'Topology',
+    bbox: [0, 0, 2, 1],
+    transform: { scale: [0.5, 0.5], translate: [10, 20] },
+    objects: {
+      districts: {
+        type: 'GeometryCollection',
+        geometries: [
+          { type: 'Polygon', arcs: [[0, 1]], properties: { id: 1 } },
+          { type: 'Polygon', arcs: [[2, ~0]], properties: { id: 2 } },
+        ]
+      }
+    },
+    arcs: [
+      [[2, 0], [0, 2]],
+      [[2, 2], [-2, 0], [0, -2], [2, 0]],
+      [[2, 0], [2, 0], [0, 2], [-2, 0]]
+    ]
+  };
+
+  it('should decode shared arcs in both directions', () => {
+    const districts = decodeFeatures<{ id: number }>(topology, 'districts');
+    expect(districts.features.map(x => x.properties.id)).to.eql([1, 2]);
+    expect(districts.features[0].geometry).to.eql({
+      type: 'Polygon',
+      coordinates: [[[11, 20], [11, 21], [10, 21], [10, 20], [11, 20]]]
+    });
+    expect(districts.features[1].geometry).to.eql({
+      type: 'Polygon',
+      coordinates: [[[11, 20], [12, 20], [12, 21], [11, 21], [11, 20]]]
+    });
+  });
+
+  it('should ignore empty geometries', () => {
+    expect(decodeGeometry(decodeArcs(topology), { type: null, properties: {} })).to.equal(null);
+  });
+});
@@ -0,0 +1,9 @@
+import sys
+from os import path
+
+# Les scripts importent leurs modules voisins directement (ex.: import utils)
+sys.path.insert(0, path.dirname(path.realpath(__file__)))
+
+import build
+
+build.main(sys.argv[1:])
@@ -0,0 +1,335 @@
+import csv
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from datetime import date
+from os import path
+import numpy as np
+import shapefile
+import climate_archive
+import climate_statistics
+import generate_catastrophes
+import heat_waves
+import station_indicators
+import update_map
+import utils
+
+# Tailles des données synthétiques: événements par source, stations, circonscriptions et points à localiser
+SIZES = {
+    'small': {'catastrophes': 10_000, 'stations': 100, 'polygons': 100, 'points': 10_000},
+    'medium': {'catastrophes': 100_000, 'stations': 500, 'polygons': 500, 'points': 100_000},
+    'large': {'catastrophes': 1_000_000, 'stations': 2_000, 'polygons': 2_000, 'points': 1_000_000},
+    'huge': {'catastrophes': 10_000_000, 'stations': 5_000, 'polygons': 5_000, 'points': 1_000_000},
+}
+# find_district parcourt toutes les circonscriptions pour chaque point: on se limite à quelques points
+FIND_DISTRICT_POINTS = 1_000
+STATION_YEARS = 10
+STATISTICS_YEARS = 50
+# Un changement des générateurs invalide les données déjà générées
+GENERATOR_VERSION = 1
+# Une étape régresse si elle dépasse la référence de plus de TOLERANCE et d'au moins MIN_REGRESSION secondes
+TOLERANCE = 0.25
+MIN_REGRESSION = 0.05
+BOUNDS = (-79.5, 45.0, -57.0, 62.5)
+EDGE_POINTS = 8
+
+benchmark_directory = path.join(utils.cache_directory, 'benchmark')
+baseline_path = path.join(benchmark_directory, 'baseline.json')
+report_path = path.join(benchmark_directory, 'report.json')
+
+
+def random_points(rng, count) -> np.ndarray:
+    min_x, min_y, max_x, max_y = BOUNDS
+    return np.column_stack([rng.uniform(min_x, max_x, count), rng.uniform(min_y, max_y, count)])
+
+
+def random_days(rng, count) -> list[date]:
+    start = date(utils.MIN_YEAR - 2, 1, 1).toordinal()
+    return [date.fromordinal(x) for x in rng.integers(start, date(2022, 12, 31).toordinal(), count).tolist()]
+
+
+def make_map(file_path, rng, count):
+    # Grille de quadrilatères déformés qui se partagent leurs arêtes, comme des circonscriptions voisines
+    columns = max(1, int(round(np.sqrt(count))))
+    rows = -(-count // columns)
+    min_x, min_y, max_x, max_y = BOUNDS
+    xs, ys = np.meshgrid(np.linspace(min_x, max_x, columns + 1), np.linspace(min_y, max_y, rows + 1))
+    jitter = 0.3 * np.array([(max_x - min_x) / columns, (max_y - min_y) / rows])
+    vertices = np.stack([xs, ys], axis=-1)
+    vertices[1:-1, 1:-1] += rng.uniform(-1, 1, vertices[1:-1, 1:-1].shape) * jitter
+
+    def edge(a, b):
+        # Mêmes points intermédiaires pour les deux circonscriptions qui partagent l'arête
+        first, last = sorted([a, b])
+        points = np.linspace(vertices[first], vertices[last], EDGE_POINTS + 2)
+        return (points if first == a else points[::-1])[:-1]
+
+    features = []
+    for i in range(count):
+        row, column = divmod(i, columns)
+        corners = [(row, column), (row, column + 1), (row + 1, column + 1), (row + 1, column)]
+        ring = np.concatenate([edge(corners[k], corners[(k + 1) % 4]) for k in range(4)])
+        coordinates = [[round(x, 6), round(y, 6)] for x, y in ring.tolist()]
+        features.append({'type': 'Feature', 'properties': {'id': i + 1},
+                         'geometry': {'type': 'Polygon', 'coordinates': [coordinates + coordinates[:1]]}})
+    with open(file_path, 'w', encoding='utf-8') as output_file:
+        json.dump({'type': 'FeatureCollection', 'features': features}, output_file)
+
+
+def make_catastrophes(directory, rng, count):
+    old_types = ['Inondation', 'Tornade', 'Orage violent', 'Vent violent', 'Autre']
+    old_severities = ['EXTRÊME', 'IMPORTANTE', 'MODÉRÉE', 'FAIBLE']
+    with open(path.join(directory, 'catastrophes_pre2020.json'), 'w', encoding='utf-8') as output_file:
+        output_file.write('{"type": "FeatureCollection", "features": [')
+        for i, ((x, y), day) in enumerate(zip(random_points(rng, count).tolist(), random_days(rng, count))):
+            output_file.write((', ' if i else '') + json.dumps({
+                'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [x, y]},
+                'properties': {'no_seq_observation': i, 'date_observation': day.strftime('%Y/%m/%d 00:00:00'),
+                               'type': old_types[i % len(old_types)], 'severite': old_severities[i % len(old_severities)],
+                               'nom': 'Ville {}'.format(i % 1000), 'imprecision': 'localisation' if i % 3 else ''}}))
+        output_file.write(']}')
+
+    new_types = ['Inondation', 'Tornade', 'Feu de forêt', 'Vent de tempête']
+    new_severities = ['menace extrême', 'menace importante', 'menace faible']
+    with open(path.join(directory, 'catastrophes_post2020.csv'), 'w', encoding='utf-8', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(['code_alea', 'alea', 'code_municipalite', 'municipalite', 'precision_localisation', '', 'severite',
+                         'date_signalement', 'date_debut', '', '', '', 'coord_x', 'coord_y'])
+        for i, ((x, y), day) in enumerate(zip(random_points(rng, count).tolist(), random_days(rng, count))):
+            writer.writerow([i % 9, new_types[i % len(new_types)], i, 'Ville {}'.format(i % 1000),
+                             'Imprécise' if i % 2 else 'Précise', '', new_severities[i % len(new_severities)],
+                             day.isoformat(), day.isoformat() if i % 2 else '', '', '', '', x, y])
+
+    os.makedirs(path.join(directory, 'Feux_pt_ori'), exist_ok=True)
+    writer = shapefile.Writer(path.join(directory, 'Feux_pt_ori', 'FEUX_PT_ORI_1972_2021'), shapeType=shapefile.POINT)
+    writer.field('ANNEE', 'N')
+    writer.field('DATE_DEBUT', 'D')
+    writer.field('LATITUDE', 'N', decimal=6)
+    writer.field('LONGITUDE', 'N', decimal=6)
+    writer.field('CLE', 'N')
+    writer.field('SUP_HA', 'N', decimal=2)
+    areas = [5, 500, 5000, 50000]
+    for i, ((x, y), day) in enumerate(zip(random_points(rng, count).tolist(), random_days(rng, count))):
+        writer.point(x, y)
+        writer.record(day.year, day, y, x, i, areas[i % len(areas)])
+    writer.close()
+
+    with open(path.join(directory, 'heat_waves.csv'), 'w', encoding='utf-8', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(['Nom', 'Station', 'Longitude', 'Latitude', 'Date de départ', 'Durée en jours'])
+        for i, ((x, y), day) in enumerate(zip(random_points(rng, count).tolist(), random_days(rng, count))):
+            writer.writerow(['Ville {}'.format(i % 1000), 7000000 + i % 5000, x, y, day.isoformat(), 3 + i % 6])
+
+
+def make_archive(directory, rng, count) -> dict[str, dict]:
+    archive = climate_archive.ClimateArchive(directory)
+    start = climate_archive.to_day('{}-01-01'.format(utils.MIN_YEAR))
+    days = np.arange(start, start + STATION_YEARS * 365, dtype=np.int32)
+    seasons = np.cos((days - start) * 2 * np.pi / 365.25)
+    stations = {}
+    for i, (x, y) in enumerate(random_points(rng, count).tolist()):
+        station_id = '7{:06d}'.format(i)
+        os.makedirs(path.join(directory, station_id), exist_ok=True)
+        mean_temp = (5 - 15 * seasons + rng.normal(0, 4, len(days))).astype(np.float32)
+        mean_temp[rng.random(len(days)) < 0.02] = np.nan
+        columns = {
+            'date': days,
+            'max_temp': mean_temp + 6,
+            'min_temp': mean_temp - 6,
+            'mean_temp': mean_temp,
+            'total_precip': rng.exponential(2.7, len(days)).astype(np.float32)
+        }
+        for column, (dtype, _) in climate_archive.COLUMNS.items():
+            columns[column].astype(dtype).tofile(archive._column_path(station_id, column))
+        stations[station_id] = {'name': 'Station {}'.format(i), 'loc': [x, y]}
+    return stations
+
+
+def make_statistics(directory, rng, regions):
+    years = range(utils.MIN_YEAR, utils.MIN_YEAR + STATISTICS_YEARS)
+    for prop, (file_name, title) in station_indicators.INDICATORS.items():
+        values = rng.normal(5, 3, (len(years), regions)).round(3)
+        values[rng.random(values.shape) < 0.01] = np.nan
+        with open(path.join(directory, '{}.csv'.format(file_name)), 'w', encoding='utf-8', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow([title] + ['{} - Région {}'.format(x + 1, x + 1) for x in range(regions)])
+            for year, row in zip(years, values.tolist()):
+                writer.writerow([year] + ['' if np.isnan(x) else x for x in row])
+
+
+def prepare(size) -> str:
+    directory = path.join(benchmark_directory, size)
+    marker = path.join(directory, 'version')
+    try:
+        with open(marker, 'r', encoding='utf-8') as input_file:
+            if json.load(input_file) == [GENERATOR_VERSION, SIZES[size]]:
+                return directory
+    except (OSError, ValueError):
+        pass
+
+    print('Generating {} data in {}'.format(size, directory))
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(path.join(directory, 'output'))
+    rng = np.random.default_rng(GENERATOR_VERSION)
+    config = SIZES[size]
+    make_map(path.join(directory, 'carte_electorale.json'), rng, config['polygons'])
+    make_catastrophes(directory, rng, config['catastrophes'])
+    stations = make_archive(path.join(directory, 'archive'), rng, config['stations'])
+    with open(path.join(directory, 'stations.json'), 'w', encoding='utf-8') as output_file:
+        json.dump(stations, output_file)
+    make_statistics(directory, rng, config['polygons'])
+    with open(marker, 'w', encoding='utf-8') as output_file:
+        json.dump([GENERATOR_VERSION, SIZES[size]], output_file)
+    return directory
+
+
+def count(items) -> int:
+    return sum(1 for _ in items)
+
+
+def stages(directory, size):
+    # Chaque étape retourne le nombre d'éléments traités
+    config = SIZES[size]
+    map_path = path.join(directory, 'carte_electorale.json')
+    points = random_points(np.random.default_rng(0), config['points']).tolist()
+    with open(path.join(directory, 'stations.json'), 'r', encoding='utf-8') as input_file:
+        stations = json.load(input_file)
+    archive_directory = path.join(directory, 'archive')
+    output_directory = path.join(directory, 'output')
+
+    def load_map():
+        # Sans le cache WKB, pour mesurer la lecture et la construction des géométries
+        shutil.rmtree(utils.cache_directory, ignore_errors=True)
+        return len(utils.load_map(map_path))
+
+    def load_map_cached():
+        return len(utils.load_map(map_path))
+
+    def find_district():
+        shapes = utils.load_map(map_path)
+        return count(utils.find_district(shapes, x) for x in points[:FIND_DISTRICT_POINTS])
+
+    def district_locator():
+        return len(utils.DistrictLocator(utils.load_map(map_path)).locate_all(points))
+
+    def parser(function, file_name):
+        return lambda: count(function(path.join(directory, file_name)))
+
+    def write_heat_waves():
+        heat_waves.write_heat_waves(stations, archive_directory=archive_directory, destination=output_directory)
+        return len(stations)
+
+    def write_indicators():
+        station_indicators.write_indicators(stations, archive_directory, output_directory)
+        return len(stations)
+
+    def statistics():
+        cube = climate_statistics.StatisticsCube(list(station_indicators.INDICATORS))
+        for prop, (file_name, _) in station_indicators.INDICATORS.items():
+            cube.add(prop, *climate_statistics.read_table(path.join(directory, '{}.csv'.format(file_name))))
+        deltas = cube.metric('avg_temp') - cube.baseline('avg_temp', utils.MIN_YEAR, utils.MIN_YEAR + 9)
+        climate_statistics.first_crossing(deltas, 1.5)
+        for prop in cube.metrics:
+            cube.trend(prop)
+        return cube.values.size
+
+    def map_mask():
+        update_map.build_mask(list(utils.load_map(map_path).values()))
+        return config['polygons']
+
+    return {
+        'load_map': load_map,
+        'load_map_cached': load_map_cached,
+        'find_district': find_district,
+        'district_locator': district_locator,
+        'parse_old_file': parser(generate_catastrophes.parse_old_file, 'catastrophes_pre2020.json'),
+        'parse_new_file': parser(generate_catastrophes.parse_new_file, 'catastrophes_post2020.csv'),
+        'parse_shp': parser(generate_catastrophes.parse_shp, path.join('Feux_pt_ori', 'FEUX_PT_ORI_1972_2021.shp')),
+        'parse_heat_waves': parser(generate_catastrophes.parse_heat_waves, 'heat_waves.csv'),
+        'heat_waves': write_heat_waves,
+        'station_indicators': write_indicators,
+        'statistics': statistics,
+        'map_mask': map_mask,
+    }
+
+
+def run(size, selected=None, repeat=3) -> dict:
+    directory = prepare(size)
+    # Le cache des cartes synthétiques ne doit pas remplacer celui de la vraie carte
+    utils.cache_directory = path.join(directory, 'cache')
+    results = {}
+    for name, stage in stages(directory, size).items():
+        if selected and name not in selected:
+            continue
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            start_cpu = time.process_time()
+            items = stage()
+            timings.append((time.perf_counter() - start, time.process_time() - start_cpu))
+        seconds, cpu_seconds = min(timings)
+        results[name] = {'seconds': round(seconds, 4), 'cpu_seconds': round(cpu_seconds, 4), 'items': items}
+        print('{:<20} {:>10.3f} s {:>12} items'.format(name, seconds, items))
+    return results
+
+
+def regressions(size, results, baseline, tolerance=TOLERANCE) -> list[str]:
+    messages = []
+    for name, result in results.items():
+        reference = baseline.get(size, {}).get(name)
+        if reference is None:
+            continue
+        limit = max(reference['seconds'] * (1 + tolerance), reference['seconds'] + MIN_REGRESSION)
+        if result['seconds'] > limit:
+            messages.append('{}: {:.3f} s, baseline {:.3f} s'.format(name, result['seconds'], reference['seconds']))
+    return messages
+
+
+def load_json(file_path) -> dict:
+    try:
+        with open(file_path, 'r', encoding='utf-8') as input_file:
+            return json.load(input_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_json(file_path, value):
+    os.makedirs(path.dirname(path.abspath(file_path)), exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8') as output_file:
+        json.dump(value, output_file, indent=1, sort_keys=True)
+
+
+def main(argv: list[str]) -> int:
+    options = dict((x[2:].split('=', 1) + [''])[:2] for x in argv if x.startswith('--'))
+    size = options.get('size', 'small')
+    if size not in SIZES:
+        raise SystemExit('Unknown size: {} ({})'.format(size, ', '.join(SIZES)))
+    selected = [x for x in argv if not x.startswith('--')]
+    baseline_file = options.get('baseline', baseline_path)
+
+    results = run(size, selected, int(options.get('repeat', 3)))
+    write_json(options.get('output', report_path), {
+        'size': size,
+        'config': SIZES[size],
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processors': os.cpu_count(),
+        'stages': results
+    })
+
+    baseline = load_json(baseline_file)
+    if 'update-baseline' in options:
+        baseline.setdefault(size, {}).update(results)
+        write_json(baseline_file, baseline)
+        return 0
+    failures = regressions(size, results, baseline, float(options.get('tolerance', TOLERANCE)))
+    for message in failures:
+        print('Regression: ' + message)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
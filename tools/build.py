@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent import futures
+from dataclasses import dataclass, field
+from os import path
+
+tools_directory = path.dirname(path.realpath(__file__))
+root_directory = path.realpath(path.join(tools_directory, '..'))
+state_path = path.join(tools_directory, '.build_state.json')
+
+
+@dataclass
+class Target:
+    name: str
+    script: str
+    inputs: list[str]
+    outputs: list[str]
+    # Une cible « always » dépend de ressources externes (réseau) et n'est exécutée que sur demande
+    always: bool = False
+    args: list[str] = field(default_factory=list)
+
+
+# Chemins relatifs à la racine du dépôt
+TARGETS = [
+    Target('map', 'update_map.py',
+           ['tools/utils.py', 'tools/instrumentation.py', 'tools/topology.py', 'tools/data/carte_simple.kml',
+            'tools/data/liste_circonscriptions.csv'],
+           ['public/data/carte_electorale.json', 'public/data/masque_electoral.json', 'src/models/districts.json',
+            'public/data/carte_electorale_niveaux.json', 'public/data/carte_electorale_low.topo.json',
+            'public/data/carte_electorale_medium.topo.json', 'public/data/carte_electorale_high.topo.json']),
+    Target('candidates', 'generate_candidates.py',
+           ['tools/utils.py', 'tools/data/candidatures.csv', 'tools/data/liste_circonscriptions.csv'],
+           ['public/data/candidates.json']),
+    Target('highlights', 'generate_highlights.py',
+           ['tools/utils.py', 'tools/data/highlights'],
+           ['public/data/highlights']),
+    Target('statistics', 'generate_meteo_data.py',
+           ['tools/utils.py', 'tools/climate_statistics.py', 'tools/station_indicators.py',
+            'tools/data/temperatures_moy_regions.csv', 'tools/data/temperatures_moy_circs.csv',
+            'tools/data/precipitations_moy_regions.csv', 'tools/data/precipitations_moy_circs.csv',
+            'tools/data/nb_jours_plus_30_deg.csv', 'tools/data/nb_jours_moins_25_deg_regions.csv',
+            'tools/data/nb_jours_moins_25_deg_circs.csv', 'tools/data/temperatures_moy_stations.csv',
+            'tools/data/precipitations_moy_stations.csv', 'tools/data/nb_jours_plus_30_deg_stations.csv',
+            'tools/data/nb_jours_moins_25_deg_stations.csv'],
+           ['public/data/statistics.json']),
+    Target('climate', 'fetch_climate_data.py',
+           ['tools/utils.py', 'tools/instrumentation.py', 'tools/climate_archive.py', 'tools/climate_downloader.py',
+            'tools/climate_manifest.py', 'tools/climate_stations.py', 'tools/heat_waves.py',
+            'tools/station_indicators.py', 'tools/data/climate_station_list.csv', 'tools/data/municipalites.csv'],
+           ['tools/data/heat_waves.csv', 'tools/data/temperatures_moy_stations.csv',
+            'tools/data/precipitations_moy_stations.csv', 'tools/data/nb_jours_plus_30_deg_stations.csv',
+            'tools/data/nb_jours_moins_25_deg_stations.csv'], always=True),
+    Target('catastrophes', 'generate_catastrophes.py',
+           ['tools/utils.py', 'tools/instrumentation.py', 'tools/catastrophe_clusters.py', 'tools/catastrophe_store.py',
+            'tools/data/catastrophes_pre2020.json', 'tools/data/catastrophes_post2020.csv',
+            'tools/data/Feux_pt_ori', 'tools/data/heat_waves.csv', 'public/data/carte_electorale.json',
+            'src/models/districts.json'],
+           ['public/data/catastrophes.json', 'public/data/catastrophes'], args=['--compact']),
+    Target('publish', 'publish_data.py',
+           ['tools/utils.py', 'public/data/candidates.json', 'public/data/highlights', 'public/data/statistics.json',
+            'public/data/carte_electorale_niveaux.json', 'public/data/carte_electorale_low.topo.json',
+            'public/data/carte_electorale_medium.topo.json', 'public/data/carte_electorale_high.topo.json',
+            'public/data/catastrophes'],
+           ['public/data/manifest.json', 'public/data/v']),
+]
+
+
+def hash_path(relative_path) -> str:
+    full_path = path.join(root_directory, relative_path)
+    digest = hashlib.sha256()
+    if path.isdir(full_path):
+        for directory, directories, files in os.walk(full_path):
+            directories.sort()
+            for name in sorted(files):
+                file_path = path.join(directory, name)
+                digest.update(path.relpath(file_path, full_path).encode('utf-8'))
+                digest.update(hash_path(path.relpath(file_path, root_directory)).encode('ascii'))
+    elif path.isfile(full_path):
+        with open(full_path, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(1 << 20), b''):
+                digest.update(chunk)
+    else:
+        return 'missing'
+    return digest.hexdigest()
+
+
+def target_inputs(target: Target) -> list[str]:
+    return ['tools/' + target.script] + target.inputs
+
+
+def dependencies(target: Target, targets: list[Target]) -> set[str]:
+    inputs = set(target_inputs(target))
+    return {x.name for x in targets if x is not target and inputs.intersection(x.outputs)}
+
+
+def load_state() -> dict:
+    try:
+        with open(state_path, 'r', encoding='utf-8') as input_file:
+            return json.load(input_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state: dict):
+    with open(state_path, 'w', encoding='utf-8') as output_file:
+        json.dump(state, output_file, indent=1, sort_keys=True)
+
+
+def is_up_to_date(target: Target, state: dict) -> bool:
+    previous = state.get(target.name)
+    if target.always or previous is None:
+        return False
+    inputs = {x: hash_path(x) for x in target_inputs(target)}
+    outputs = {x: hash_path(x) for x in target.outputs}
+    return previous['inputs'] == inputs and previous['outputs'] == outputs
+
+
+def run_target(target: Target) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, target.script] + target.args, cwd=tools_directory)
+
+
+def select_targets(names: list[str]) -> list[Target]:
+    by_name = {x.name: x for x in TARGETS}
+    unknown = [x for x in names if x not in by_name]
+    if unknown:
+        raise SystemExit('Unknown targets: {}'.format(', '.join(unknown)))
+    if names:
+        return [by_name[x] for x in names]
+    # Les cibles « always » ne sont pas exécutées par défaut
+    return [x for x in TARGETS if not x.always]
+
+
+def build(names: list[str] = (), force=False, jobs=None) -> bool:
+    selected = select_targets(list(names))
+    selected_names = {x.name for x in selected}
+    pending = {x.name: dependencies(x, TARGETS) & selected_names for x in selected}
+    by_name = {x.name: x for x in selected}
+    state = load_state()
+    failed = set()
+
+    with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while pending or running:
+            ready = [x for x, deps in pending.items() if not deps]
+            while ready:
+                name = ready.pop()
+                del pending[name]
+                target = by_name[name]
+                if not force and is_up_to_date(target, state):
+                    print('[{}] up to date'.format(name))
+                    for other, deps in pending.items():
+                        if name in deps:
+                            deps.discard(name)
+                            if not deps:
+                                ready.append(other)
+                    continue
+                print('[{}] running {}'.format(name, target.script))
+                running[executor.submit(run_target, target)] = target
+
+            if not running:
+                if pending:
+                    # Dépendances en échec: les cibles restantes sont ignorées
+                    for name in pending:
+                        print('[{}] skipped'.format(name))
+                    failed.update(pending)
+                break
+
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                target = running.pop(future)
+                if future.result().returncode == 0:
+                    state[target.name] = {
+                        'inputs': {x: hash_path(x) for x in target_inputs(target)},
+                        'outputs': {x: hash_path(x) for x in target.outputs}
+                    }
+                    save_state(state)
+                    for deps in pending.values():
+                        deps.discard(target.name)
+                else:
+                    print('[{}] failed'.format(target.name))
+                    failed.add(target.name)
+    return not failed
+
+
+def main(argv: list[str]):
+    force = '--force' in argv
+    names = [x for x in argv if not x.startswith('--')]
+    if names and names[0] == 'build':
+        names = names[1:]
+    if names and names[0] == 'list':
+        for target in TARGETS:
+            deps = dependencies(target, TARGETS)
+            print('{}: {}{}'.format(target.name, target.script, ' (after {})'.format(', '.join(sorted(deps))) if deps else ''))
+        return
+    if not build(names, force):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
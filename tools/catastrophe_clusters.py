@@ -0,0 +1,70 @@
+import json
+import math
+
+# Niveaux de zoom de la carte regroupés, au-delà les événements sont affichés individuellement
+# IFCHANGE: MAX_CLUSTER_ZOOM dans src/models/catastrophes.ts
+MIN_CLUSTER_ZOOM = 5
+MAX_CLUSTER_ZOOM = 10
+# Taille d'une cellule de la grille, en pixels à l'écran
+CLUSTER_RADIUS = 64
+TILE_SIZE = 256
+
+
+def project(lng: float, lat: float, zoom: int) -> tuple[float, float]:
+    # Coordonnées en pixels dans la projection Web Mercator utilisée par Leaflet
+    scale = TILE_SIZE * (1 << zoom)
+    sin = min(max(math.sin(math.radians(lat)), -0.9999), 0.9999)
+    return (lng + 180) / 360 * scale, (0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * scale
+
+
+class ClusterIndex:
+    # Une cellule de taille fixe en pixels au zoom z contient exactement quatre cellules du zoom z + 1:
+    # les niveaux plus grossiers sont obtenus en divisant les index des cellules du niveau le plus fin par deux
+    def __init__(self, min_zoom=MIN_CLUSTER_ZOOM, max_zoom=MAX_CLUSTER_ZOOM, radius=CLUSTER_RADIUS):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.radius = radius
+        self.types: dict[str, int] = {}
+        # (x, y, type) -> [nombre, somme des longitudes, somme des latitudes, document si la cellule n'en a qu'un]
+        self.cells: dict[tuple[int, int, int], list] = {}
+
+    def add(self, lng: float, lat: float, type: str, document: str = None):
+        # `document`: l'événement sérialisé en JSON, repris dans les cellules où il est seul
+        x, y = project(lng, lat, self.max_zoom)
+        key = (int(x // self.radius), int(y // self.radius), self.types.setdefault(type, len(self.types)))
+        cell = self.cells.setdefault(key, [0, 0.0, 0.0, None])
+        cell[0] += 1
+        cell[1] += lng
+        cell[2] += lat
+        cell[3] = document if cell[0] == 1 else None
+
+    def levels(self) -> tuple[dict[int, list[list]], list[str]]:
+        # Niveaux de zoom et documents des événements seuls dans leur cellule, partagés entre les niveaux
+        result = {}
+        events: dict[str, int] = {}
+        cells = self.cells
+        for zoom in range(self.max_zoom, self.min_zoom - 1, -1):
+            # Lignes: x, y, type, nombre, position moyenne et, pour un événement seul, son index dans les documents
+            result[zoom] = [[x, y, type, count, round(lng / count, 5), round(lat / count, 5)]
+                            + ([events.setdefault(document, len(events))] if document is not None else [])
+                            for (x, y, type), (count, lng, lat, document) in sorted(cells.items())]
+            parents = {}
+            for (x, y, type), (count, lng, lat, document) in cells.items():
+                parent = parents.setdefault((x >> 1, y >> 1, type), [0, 0.0, 0.0, None])
+                parent[0] += count
+                parent[1] += lng
+                parent[2] += lat
+                parent[3] = document if parent[0] == count else None
+            cells = parents
+        return dict(sorted(result.items())), list(events)
+
+    def to_json(self) -> str:
+        levels, events = self.levels()
+        return json.dumps({
+            'radius': self.radius,
+            'min_zoom': self.min_zoom,
+            'max_zoom': self.max_zoom,
+            'types': list(self.types),
+            'zooms': {str(zoom): rows for zoom, rows in levels.items()},
+            'events': [json.loads(x) for x in events]
+        }, ensure_ascii=False, separators=(',', ':'))
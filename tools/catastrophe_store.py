@@ -0,0 +1,109 @@
+import os
+import sqlite3
+
+# Colonnes d'un événement, dans l'ordre des tuples acceptés par upsert_source
+FIELDS = ['id', 'day', 'x', 'y', 'type', 'severity', 'loc_approx', 'city']
+# Un changement d'un de ces champs n'a pas d'effet sur la circonscription
+DATA_FIELDS = ['day', 'type', 'severity', 'loc_approx', 'city']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS catastrophes (
+    source TEXT NOT NULL,
+    id TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    x REAL NOT NULL,
+    y REAL NOT NULL,
+    type TEXT NOT NULL,
+    severity INTEGER NOT NULL,
+    loc_approx INTEGER NOT NULL,
+    city TEXT,
+    located INTEGER NOT NULL DEFAULT 0,
+    district INTEGER,
+    PRIMARY KEY (source, id)
+);
+CREATE INDEX IF NOT EXISTS catastrophes_order ON catastrophes (year, day, rank, position);
+CREATE INDEX IF NOT EXISTS catastrophes_located ON catastrophes (located);
+'''
+
+
+class CatastropheStore:
+    # Événements déjà analysés, indexés par source et identifiant, avec leur circonscription.
+    # Les dates sont des ordinaux (date.toordinal) et l'année est conservée pour réécrire seulement les années touchées
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.connection.commit()
+        self.connection.close()
+
+    def get_meta(self, key) -> str | None:
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value: str):
+        self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def clear(self):
+        self.connection.execute('DELETE FROM catastrophes')
+        self.connection.execute('DELETE FROM meta')
+
+    def years(self) -> list[int]:
+        return [x for x, in self.connection.execute('SELECT DISTINCT year FROM catastrophes ORDER BY year')]
+
+    def upsert_source(self, source, rank, rows, year_of) -> set[int]:
+        # Remplace le contenu d'une source et retourne les années dont le contenu a changé.
+        # Une circonscription déjà calculée est conservée tant que la position ne change pas
+        connection = self.connection
+        connection.execute('DROP TABLE IF EXISTS incoming')
+        connection.execute('CREATE TEMP TABLE incoming (position INTEGER, year INTEGER, {})'.format(', '.join(FIELDS)))
+        connection.executemany('INSERT INTO incoming VALUES ({})'.format(', '.join('?' * (len(FIELDS) + 2))),
+                               ((position, year_of(row[1])) + tuple(row) for position, row in enumerate(rows)))
+        # Pour un identifiant en double, la dernière ligne l'emporte
+        connection.execute('DELETE FROM incoming WHERE position NOT IN (SELECT MAX(position) FROM incoming GROUP BY id)')
+
+        changed = ' OR '.join('c.{0} IS NOT i.{0}'.format(x) for x in DATA_FIELDS + ['x', 'y'])
+        affected = {x for x, in connection.execute('''
+            SELECT i.year FROM incoming i LEFT JOIN catastrophes c ON c.source = ? AND c.id = i.id
+            WHERE c.id IS NULL OR {}
+            UNION SELECT c.year FROM catastrophes c LEFT JOIN incoming i ON i.id = c.id
+            WHERE c.source = ? AND (i.id IS NULL OR {})'''.format(changed, changed), (source, source))}
+
+        connection.execute('DELETE FROM catastrophes WHERE source = ? AND id NOT IN (SELECT id FROM incoming)', (source,))
+        connection.execute('''
+            INSERT INTO catastrophes (source, id, rank, position, year, {0})
+            SELECT ?, id, ?, position, year, {0} FROM incoming WHERE true
+            ON CONFLICT (source, id) DO UPDATE SET
+                rank = excluded.rank, position = excluded.position, year = excluded.year, {1},
+                located = located AND x = excluded.x AND y = excluded.y'''.format(
+            ', '.join(FIELDS[1:]), ', '.join('{0} = excluded.{0}'.format(x) for x in FIELDS[1:])), (source, rank))
+        connection.execute('DROP TABLE incoming')
+        return affected
+
+    def reset_districts(self):
+        self.connection.execute('UPDATE catastrophes SET located = 0')
+
+    def unlocated(self) -> list[tuple[str, str, float, float]]:
+        return self.connection.execute('SELECT source, id, x, y FROM catastrophes WHERE located = 0').fetchall()
+
+    def set_districts(self, districts):
+        # districts: (source, id, circonscription ou None)
+        self.connection.executemany('UPDATE catastrophes SET located = 1, district = ? WHERE source = ? AND id = ?',
+                                    ((district, source, id) for source, id, district in districts))
+
+    def records(self, year):
+        return self.connection.execute('''
+            SELECT {}, district FROM catastrophes WHERE year = ?
+            ORDER BY day, rank, position'''.format(', '.join(FIELDS)), (year,))
+
+    def commit(self):
+        self.connection.commit()
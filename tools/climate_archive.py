@@ -0,0 +1,126 @@
+import csv
+import os
+import sys
+from datetime import date, datetime, timedelta
+import numpy as np
+import utils
+
+EPOCH = date(1970, 1, 1)
+
+climate_directory = os.path.join(utils.source_directory, 'raw_climate_data')
+archive_directory = os.path.join(climate_directory, 'archive')
+
+# Colonnes conservées: nom -> (type, index dans les CSV d'Environnement Canada)
+COLUMNS = {
+    'date': (np.dtype('<i4'), 4),
+    'max_temp': (np.dtype('<f4'), 9),
+    'min_temp': (np.dtype('<f4'), 11),
+    'mean_temp': (np.dtype('<f4'), 13),
+    'total_precip': (np.dtype('<f4'), 23),
+}
+
+
+def to_day(value: str) -> int:
+    return (datetime.strptime(value, '%Y-%m-%d').date() - EPOCH).days
+
+
+def from_day(day: int) -> date:
+    return EPOCH + timedelta(days=int(day))
+
+
+def parse_value(value: str) -> float:
+    return float(value) if value else np.nan
+
+
+class ClimateArchive:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _column_path(self, station_id, column):
+        return os.path.join(self.directory, station_id, '{}.bin'.format(column))
+
+    def stations(self) -> list[str]:
+        return sorted(x for x in os.listdir(self.directory) if os.path.isfile(self._column_path(x, 'date')))
+
+    def __contains__(self, station_id):
+        return os.path.isfile(self._column_path(station_id, 'date'))
+
+    def _length(self, station_id) -> int:
+        # Une écriture interrompue peut laisser des colonnes de longueurs différentes
+        lengths = []
+        for column, (dtype, _) in COLUMNS.items():
+            try:
+                lengths.append(os.path.getsize(self._column_path(station_id, column)) // dtype.itemsize)
+            except OSError:
+                return 0
+        return min(lengths)
+
+    def load(self, station_id, columns=None) -> dict[str, np.ndarray]:
+        length = self._length(station_id)
+        result = {}
+        for column in columns or COLUMNS.keys():
+            dtype = COLUMNS[column][0]
+            if length:
+                result[column] = np.memmap(self._column_path(station_id, column), dtype=dtype, mode='r', shape=(length,))
+            else:
+                result[column] = np.empty(0, dtype=dtype)
+        return result
+
+    def coverage(self, station_id) -> tuple[date | None, date | None]:
+        days = self.load(station_id, ['date'])['date']
+        if not len(days):
+            return None, None
+        return from_day(days[0]), from_day(days[-1])
+
+    def append(self, station_id, lines) -> int:
+        days = self.load(station_id, ['date'])['date']
+        last = int(days[-1]) if len(days) else None
+
+        records = {}
+        for line in lines:
+            day = to_day(line[4])
+            if last is None or day > last:
+                records[day] = line
+        if not records:
+            return 0
+
+        rows = [records[x] for x in sorted(records.keys())]
+        length = len(days)
+        del days
+        os.makedirs(os.path.join(self.directory, station_id), exist_ok=True)
+        for column, (dtype, index) in COLUMNS.items():
+            if column == 'date':
+                values = np.array([to_day(x[index]) for x in rows], dtype=dtype)
+            else:
+                values = np.array([parse_value(x[index]) for x in rows], dtype=dtype)
+            # Les lignes d'une écriture interrompue sont retirées pour que toutes les colonnes restent alignées
+            with open(self._column_path(station_id, column), 'ab') as output_file:
+                output_file.truncate(length * dtype.itemsize)
+                output_file.write(values.tobytes())
+        return len(rows)
+
+    def import_csv(self, station_id, path) -> int:
+        with open(path, 'r', encoding='utf-8') as input_file:
+            return self.append(station_id, csv.reader(input_file))
+
+    def export_csv(self, station_id, path):
+        data = self.load(station_id)
+        with open(path, 'w', encoding='utf-8', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(COLUMNS.keys())
+            for i, day in enumerate(data['date']):
+                row = [from_day(day).isoformat()]
+                for column in list(COLUMNS.keys())[1:]:
+                    value = data[column][i]
+                    row.append('' if np.isnan(value) else '{:g}'.format(value))
+                writer.writerow(row)
+
+
+if __name__ == '__main__':
+    # Exporte en CSV les stations demandées (ou toutes) pour déboguer
+    archive = ClimateArchive(archive_directory)
+    export_directory = os.path.join(climate_directory, 'export')
+    os.makedirs(export_directory, exist_ok=True)
+    for station_id in sys.argv[1:] or archive.stations():
+        archive.export_csv(station_id, os.path.join(export_directory, '{}.csv'.format(station_id)))
@@ -0,0 +1,122 @@
+import csv
+import http.client
+import io
+import threading
+import time
+from urllib import parse
+
+BASE_URL = 'https://dd.weather.gc.ca'
+URL_TEMPLATE = '/climate/observations/daily/csv/{province}/climate_daily_{province}_{station_id}_{year}-{month:02d}_P1D.csv'
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36',
+    'Connection': 'keep-alive'
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    pass
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            scheduled = max(now, self._next_time)
+            self._next_time = scheduled + self.interval
+        if scheduled > now:
+            time.sleep(scheduled - now)
+
+
+class ClimateDownloader:
+    def __init__(self, base_url=BASE_URL, concurrency=8, requests_per_second=20.0, retries=4, backoff=0.5, timeout=30):
+        url = parse.urlsplit(base_url)
+        self.scheme = url.scheme
+        self.host = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.requests_per_second = requests_per_second
+        self._limiters: dict[str, RateLimiter] = {}
+        self._limiters_lock = threading.Lock()
+        self._local = threading.local()
+        self._connections: list[http.client.HTTPConnection] = []
+
+    def _limiter(self, host) -> RateLimiter:
+        with self._limiters_lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = RateLimiter(self.requests_per_second)
+            return limiter
+
+    def _connection(self) -> http.client.HTTPConnection:
+        # Une connexion persistante par fil d'exécution
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if self.scheme == 'https':
+                connection = http.client.HTTPSConnection(self.host, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(self.host, timeout=self.timeout)
+            self._local.connection = connection
+            with self._limiters_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _reset_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+            with self._limiters_lock:
+                self._connections.remove(connection)
+
+    def close(self):
+        with self._limiters_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_csv(self, url_path) -> list[list[str]] | None:
+        for attempt in range(self.retries + 1):
+            self._limiter(self.host).wait()
+            connection = self._connection()
+            try:
+                connection.request('GET', self.prefix + url_path, headers=HEADERS)
+                response = connection.getresponse()
+                if response.status == 200:
+                    # Les lignes sont décodées au fil de la réception
+                    reader = csv.reader(io.TextIOWrapper(response, encoding='latin1', newline=''))
+                    next(reader, None)
+                    return list(reader)
+                response.read()
+                if response.will_close:
+                    self._reset_connection()
+                if response.status == 404:
+                    return None
+                if response.status not in RETRY_STATUSES:
+                    raise DownloadError('{} {}: {}'.format(response.status, response.reason, url_path))
+            except (OSError, http.client.HTTPException):
+                self._reset_connection()
+                if attempt >= self.retries:
+                    raise
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+        raise DownloadError('Too many retries: {}'.format(url_path))
+
+    def fetch_month(self, station_id, year, month, province='QC') -> list[list[str]] | None:
+        return self.get_csv(URL_TEMPLATE.format(province=province, station_id=station_id, year=year, month=month))
@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+DATE_FORMAT = '%Y-%m-%d'
+# Délai après la fin d'un mois avant de considérer qu'un mois sans données le restera
+EMPTY_MONTH_GRACE = timedelta(days=90)
+# Délai minimal entre deux vérifications d'une même station
+REFRESH_INTERVAL = timedelta(hours=12)
+
+
+def month_end(year, month) -> datetime:
+    if month >= 12:
+        return datetime(year + 1, 1, 1) - timedelta(days=1)
+    return datetime(year, month + 1, 1) - timedelta(days=1)
+
+
+def format_month(year, month) -> str:
+    return '{}-{:02d}'.format(year, month)
+
+
+class ClimateManifest:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as input_file:
+                self.stations: dict[str, dict] = json.load(input_file)
+        except (OSError, ValueError):
+            self.stations = {}
+
+    def __contains__(self, station_id):
+        return station_id in self.stations
+
+    def save(self):
+        with self._lock:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as output_file:
+                json.dump(self.stations, output_file, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+    def coverage(self, station_id) -> tuple[datetime | None, datetime | None]:
+        entry = self.stations.get(station_id, {})
+        first = entry.get('first')
+        last = entry.get('last')
+        return (datetime.strptime(first, DATE_FORMAT) if first else None,
+                datetime.strptime(last, DATE_FORMAT) if last else None)
+
+    def stale_months(self, station_id, months, now: datetime) -> list[datetime]:
+        entry = self.stations.get(station_id)
+        if entry is None:
+            return list(months)
+
+        checked = entry.get('checked')
+        if checked and now - datetime.fromisoformat(checked) < REFRESH_INTERVAL:
+            return []
+
+        _, last = self.coverage(station_id)
+        empty_months = entry.get('empty', {})
+        result = []
+        for month in months:
+            if last is not None and month_end(month.year, month.month) <= last:
+                continue
+            empty_checked = empty_months.get(format_month(month.year, month.month))
+            if empty_checked and datetime.fromisoformat(empty_checked) - month_end(month.year, month.month) > EMPTY_MONTH_GRACE:
+                continue
+            result.append(month)
+        return result
+
+    def update(self, station_id, first: datetime | None, last: datetime | None, empty_months=(), checked: datetime | None = None):
+        with self._lock:
+            entry = self.stations.setdefault(station_id, {})
+            if first is not None:
+                entry['first'] = first.strftime(DATE_FORMAT)
+            if last is not None:
+                entry['last'] = last.strftime(DATE_FORMAT)
+
+            empty = entry.setdefault('empty', {})
+            for month in empty_months:
+                empty[format_month(month.year, month.month)] = checked.isoformat(timespec='seconds')
+            # Les mois vides antérieurs aux dernières données reçues ne seront plus demandés
+            if last is not None:
+                limit = format_month(last.year, last.month)
+                for key in [x for x in empty if x <= limit]:
+                    del empty[key]
+
+            if checked is not None:
+                entry['checked'] = checked.isoformat(timespec='seconds')
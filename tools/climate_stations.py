@@ -0,0 +1,38 @@
+import os
+import csv
+from datetime import datetime
+import utils
+
+
+def load_provinces(codes: list[str]) -> dict[str, dict[str, dict]]:
+    # Stations de chaque province demandée (codes de utils.PROVINCES), en une seule lecture de la liste
+    names = {utils.PROVINCES[x]: x for x in codes}
+    # La liste des municipalités ne couvre que le Québec
+    cities = utils.load_municipalities() if utils.DEFAULT_PROVINCE in codes else None
+
+    provinces = {x: {} for x in codes}
+
+    with open(os.path.join(utils.source_directory, 'climate_station_list.csv'), 'r', encoding='utf-8') as input_file:
+        reader = csv.reader(input_file)
+        next(reader, None)
+        for line in reader:
+            raw_name, station_province, lat, lng, alt, clim_id, wmo_id, tc_id, fyr, lyr, hfyr, hlyr, dfyr, dlyr, mfyr, mlyr = line
+            code = names.get(station_province)
+            if code is None:
+                continue
+            if not dfyr or not dlyr or int(dlyr) < utils.MIN_YEAR:
+                continue
+
+            name = cities.longest_prefix(raw_name, '') if code == utils.DEFAULT_PROVINCE else raw_name.title()
+            provinces[code][clim_id] = {
+                'name': name,
+                'loc': [float(lng), float(lat)],
+                'start': datetime(max(int(dfyr), utils.MIN_YEAR), 1, 1),
+                'end': min(datetime(int(dlyr), 12, 31), datetime.now())
+            }
+    return provinces
+
+
+def load_stations(province='QUEBEC') -> dict[str, dict]:
+    code = next(k for k, v in utils.PROVINCES.items() if v == province)
+    return load_provinces([code])[code]
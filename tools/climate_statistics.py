@@ -0,0 +1,103 @@
+import csv
+import re
+import numpy as np
+
+number_pattern = re.compile(r'(\d+)')
+
+
+def parse_header(header):
+    match = number_pattern.search(header)
+    if match:
+        return int(match.group(1), 10)
+    return 0
+
+
+def read_table(file_path) -> tuple[list[int], list[str], np.ndarray]:
+    # Une ligne par année, une colonne par région (0 pour la province); les cellules vides deviennent NaN
+    with open(file_path, encoding='utf-8') as input_file:
+        reader = csv.reader(input_file)
+        regions = [str(parse_header(x)) for x in next(reader, None)[1:]]
+        years = []
+        rows = []
+        for line in reader:
+            match = number_pattern.search(line[0])
+            if match:
+                years.append(int(match.group(1)))
+                rows.append([float(x) if x else np.nan for x in line[1:]])
+    return years, regions, np.array(rows, dtype=np.float64).reshape(len(rows), len(regions))
+
+
+def index_of(values: list, positions: dict) -> np.ndarray:
+    return np.array([positions.setdefault(x, len(positions)) for x in values], dtype=np.intp)
+
+
+class StatisticsCube:
+    # Tableau dense année × région × indicateur, NaN lorsqu'une valeur est absente.
+    # Les années et les régions sont dans leur ordre d'apparition dans les tables
+    def __init__(self, metrics: list[str]):
+        self.metrics = list(metrics)
+        self.years: dict[int, int] = {}
+        self.regions: dict[str, int] = {}
+        self.values = np.full((0, 0, len(self.metrics)), np.nan)
+
+    def _grow(self):
+        shape = (len(self.years), len(self.regions), len(self.metrics))
+        if shape != self.values.shape:
+            values = np.full(shape, np.nan)
+            values[:self.values.shape[0], :self.values.shape[1]] = self.values
+            self.values = values
+
+    def add(self, metric, years: list[int], regions: list[str], table: np.ndarray, replace=True):
+        year_index = index_of(years, self.years)
+        region_index = index_of(regions, self.regions)
+        self._grow()
+        values = self.values[:, :, self.metrics.index(metric)]
+        cells = np.ix_(year_index, region_index)
+        # Une cellule vide ne remplace pas une valeur lue dans une table précédente. Sans `replace`, la table
+        # complète seulement les valeurs absentes
+        if replace:
+            values[cells] = np.where(np.isnan(table), values[cells], table)
+        else:
+            values[cells] = np.where(np.isnan(values[cells]), table, values[cells])
+
+    def year_list(self) -> np.ndarray:
+        return np.fromiter(self.years, dtype=np.int64, count=len(self.years))
+
+    def region_list(self) -> list[str]:
+        return list(self.regions)
+
+    def metric(self, name) -> np.ndarray:
+        return self.values[:, :, self.metrics.index(name)]
+
+    def baseline(self, name, first_year, last_year) -> np.ndarray:
+        # Moyenne par région des années first_year à last_year, NaN si aucune n'est disponible
+        years = self.year_list()
+        selected = self.metric(name)[(years >= first_year) & (years <= last_year)]
+        counts = np.sum(~np.isnan(selected), axis=0)
+        sums = np.nansum(selected, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    def trend(self, name) -> np.ndarray:
+        # Pente des moindres carrés par région, en unités par année, NaN sous deux valeurs
+        values = self.metric(name)
+        present = ~np.isnan(values)
+        years = np.where(present, self.year_list()[:, np.newaxis].astype(np.float64), 0)
+        counts = present.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_year = years.sum(axis=0) / counts
+            mean_value = np.where(present, values, 0).sum(axis=0) / counts
+            dx = np.where(present, years - mean_year, 0)
+            dy = np.where(present, values - mean_value, 0)
+            variance = (dx * dx).sum(axis=0)
+            return np.where((counts >= 2) & (variance > 0), (dx * dy).sum(axis=0) / variance, np.nan)
+
+
+def first_crossing(deltas: np.ndarray, threshold) -> tuple[np.ndarray, np.ndarray]:
+    # Pour chaque région, index de la première année (dans l'ordre du cube) où deltas >= threshold et masque
+    # des régions ayant atteint le seuil
+    above = deltas >= threshold
+    if not len(above):
+        # np.argmax refuse un axe vide: sans année, aucune région n'atteint le seuil
+        return np.zeros(above.shape[1:], dtype=np.int64), np.zeros(above.shape[1:], dtype=bool)
+    return np.argmax(above, axis=0), above.any(axis=0)
@@ -1,14 +1,19 @@
 import os
-import csv
-import multiprocessing
+import sys
+from concurrent import futures
+import numpy as np
+import climate_downloader
+import climate_manifest
+import climate_archive
+import climate_stations
+import heat_waves
+import instrumentation
+import station_indicators
 import utils
 from datetime import datetime, timedelta
-import unicodedata
-import string
-from urllib import request
 
-climate_directory = os.path.join(utils.source_directory, 'raw_climate_data')
-os.makedirs(climate_directory, exist_ok=True)
+climate_directory = climate_archive.climate_directory
+archive = climate_archive.ClimateArchive(climate_archive.archive_directory)
 
 
 def months_between(start_date, end_date):
@@ -27,124 +32,92 @@ def months_between(start_date, end_date):
             month += 1
 
 
-def download_data_for_station(station_id, start, end):
-    destination_path = os.path.join(
-        climate_directory, '{}.csv'.format(station_id))
-    records: dict[datetime, list[str]] = {}
-    try:
-        with open(destination_path, 'r', encoding='utf-8') as input_file:
-            latest = None
-            reader = csv.reader(input_file)
-            for line in reader:
-                date = datetime.strptime(line[4], '%Y-%m-%d')
-                if latest is None or date > latest:
-                    latest = date
-                records[date] = line
-            if latest is not None and latest > start:
-                start = latest + timedelta(days=1)
-            if start >= end:
-                return
-    except OSError:
-        pass
-
-    has_new_data = False
-    HEADERS = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'}
-    for poll_date in months_between(start, end):
-        url = 'https://dd.weather.gc.ca/climate/observations/daily/csv/QC/climate_daily_QC_{}_{}-{:02d}_P1D.csv'.format(
-            station_id, poll_date.year, poll_date.month)
-        req = request.Request(url, headers=HEADERS)
-        try:
-            with request.urlopen(req) as response:
-                reader = csv.reader(response.read().decode('latin1').splitlines())
-                next(reader, None)
-                for line in reader:
-                    date = datetime.strptime(line[4], '%Y-%m-%d')
-                    if date not in records:
-                        records[date] = line
-                        has_new_data = True
-        except request.HTTPError as ex:
-            if ex.code != 404:
-                raise
-
-    if has_new_data:
-        records = { key: records[key] for key in sorted(records.keys()) }
-        with open(destination_path, 'w', encoding='utf-8', newline='') as output_file:
-            writer = csv.writer(output_file)
-            writer.writerows(records.values())
+def download_data_for_station(downloader: climate_downloader.ClimateDownloader, manifest: climate_manifest.ClimateManifest, station_id, start, end, province=utils.DEFAULT_PROVINCE):
+    if station_id not in manifest:
+        # Station absente du manifeste: on reprend les données déjà archivées ou l'ancien CSV
+        legacy_path = os.path.join(climate_directory, '{}.csv'.format(station_id))
+        if station_id not in archive and os.path.isfile(legacy_path):
+            archive.import_csv(station_id, legacy_path)
+        manifest.update(station_id, *archive.coverage(station_id))
+
+    first, latest = manifest.coverage(station_id)
+    if latest is not None and latest > start:
+        start = latest + timedelta(days=1)
+    if start >= end:
+        return
+
+    now = datetime.now()
+    lines = []
+    empty_months = []
+    for poll_date in manifest.stale_months(station_id, months_between(start, end), now):
+        month_lines = downloader.fetch_month(station_id, poll_date.year, poll_date.month, province)
+        if month_lines:
+            lines.extend(month_lines)
+        else:
+            empty_months.append(poll_date)
+
+    # Les nouvelles données sont ajoutées à la suite de l'archive, sans la réécrire
+    if archive.append(station_id, lines):
+        first, latest = archive.coverage(station_id)
+    manifest.update(station_id, first, latest, empty_months, now)
+
+
+def process_provinces(provinces: dict[str, dict[str, dict]], archive_directory=climate_archive.archive_directory, processes=None):
+    # Les provinces sont traitées l'une après l'autre, ce qui borne la mémoire à celle d'une province, avec un seul
+    # groupe de processus: les indicateurs par circonscription d'une province, calculés avec sa propre carte, le sont
+    # pendant que les stations de la suivante sont analysées. Les résultats de chaque province sont écrits dans son
+    # répertoire (utils.province_directories)
+    station_archive = climate_archive.ClimateArchive(archive_directory)
+    years = station_indicators.station_years()
+    with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        merges = []
+        for code, stations in provinces.items():
+            source = utils.province_directories(code)[0]
+            os.makedirs(source, exist_ok=True)
+            with instrumentation.stage(code) as stage:
+                stage.count('stations', len(stations))
+                with instrumentation.stage('heat_waves'):
+                    heat_waves.write_heat_waves(stations, archive_directory=archive_directory, destination=source,
+                                                executor=executor)
+
+                # Sans carte des circonscriptions pour la province, seules les vagues de chaleur sont calculées
+                station_ids = [x for x in stations if x in station_archive]
+                map_path = utils.map_path(code)
+                if not station_ids or not os.path.isfile(map_path):
+                    continue
+                with instrumentation.stage('station_indicators'):
+                    values = station_indicators.station_values(executor, archive_directory, station_ids, years)
+                locations = np.array([stations[x]['loc'] for x in station_ids], dtype=np.float64)
+                merges.append(executor.submit(station_indicators.write_district_indicators, locations, values, years,
+                                              source, map_path, utils.district_names_path(code)))
+                del values
+
+        with instrumentation.stage('district_indicators'):
+            for merge in futures.as_completed(merges):
+                merge.result()
 
 
 if __name__ == '__main__':
-    cities = []
-
-    with open(os.path.join(utils.source_directory, 'municipalites.csv'), 'r', encoding='utf-8') as input_file:
-        reader = csv.reader(input_file)
-        next(reader, None)
-        for line in reader:
-            name = line[1]
-            normalized = ''.join(x for x in unicodedata.normalize(
-                'NFKD', name) if x in string.ascii_letters).replace('-', ' ').lower()
-            cities.append((normalized, name))
-
-    stations = {}
-
-    with open(os.path.join(utils.source_directory, 'climate_station_list.csv'), 'r', encoding='utf-8') as input_file:
-        reader = csv.reader(input_file)
-        next(reader, None)
-        for line in reader:
-            raw_name, province, lat, lng, alt, clim_id, wmo_id, tc_id, fyr, lyr, hfyr, hlyr, dfyr, dlyr, mfyr, mlyr = line
-            if province != 'QUEBEC':
-                continue
-            if not dfyr or not dlyr or int(dlyr) < utils.MIN_YEAR:
-                continue
-
-            name = next(
-                (x[1] for x in cities if raw_name.lower().startswith(x[0])), '')
-            stations[clim_id] = {
-                'name': name,
-                'loc': [float(lng), float(lat)],
-                'start': datetime(max(int(dfyr), utils.MIN_YEAR), 1, 1),
-                'end': min(datetime(int(dlyr), 12, 31), datetime.now())
-            }
-
-    script_path = os.path.join(
-        utils.current_directory, 'fetch_climate_data_station.py')
-
-    with multiprocessing.Pool(processes=8) as pool:
-        inputs = ((k, v['start'], v['end']) for k, v in stations.items())
-        pool.starmap(download_data_for_station, inputs)
-
-    with open(os.path.join(utils.source_directory, 'heat_waves.csv'), 'w', encoding='utf-8', newline='') as output_file:
-        writer = csv.writer(output_file)
-        writer.writerow(['Nom','Longitude','Latitude','Date de départ','Durée en jours'])
-        for station_id, station in stations.items():
-            with open(os.path.join(climate_directory, '{}.csv'.format(station_id)), 'r', encoding='utf-8') as input_file:
-                reader = csv.reader(input_file)
-                readings = []
-                for line in reader:
-                    _, _, _, _, _, year, month, day, _, max_temp, _, min_temp, _, mean_temp, _, _, _, _, _, _, _, _, _, _, _, _, _, _, _, _, _ = line
-                    if not max_temp:
-                        continue
-
-                    date = datetime(int(year), int(month), int(day))
-                    readings.append((date, float(max_temp)))
-
-            readings.sort(key=lambda x: x[0])
-
-            heat_wave_start = None
-            heat_wave_length = 0
-            for i in range(1, len(readings)):
-                last_reading = readings[i - 1]
-                reading = readings[i]
-
-                if abs(last_reading[0].toordinal() - reading[0].toordinal()) > 1 or reading[1] < 30:
-                    if heat_wave_length >= 3 and heat_wave_start is not None:
-                        writer.writerow([station['name'], station_id, station['loc'][0], station['loc'][1], heat_wave_start.strftime('%Y-%m-%d'), heat_wave_length])
-                    heat_wave_length = 0
-                else:
-                    if heat_wave_length == 0:
-                        heat_wave_start = reading[0]
-                    heat_wave_length += 1
-
-            if heat_wave_length >= 3 and heat_wave_start is not None:
-                writer.writerow([station['name'], station_id, station['loc'][0], station['loc'][1], heat_wave_start.strftime('%Y-%m-%d'), heat_wave_length])
+    # --provinces=all ou --provinces=QC,ON pour traiter d'autres provinces que le Québec
+    options = dict((x[2:].split('=', 1) + [''])[:2] for x in sys.argv[1:] if x.startswith('--'))
+    codes = utils.parse_provinces(options.get('provinces', utils.DEFAULT_PROVINCE))
+    processes = int(options['processes']) if options.get('processes') else None
+
+    with instrumentation.run('fetch_climate_data'):
+        provinces = climate_stations.load_provinces(codes)
+
+        manifest = climate_manifest.ClimateManifest(os.path.join(climate_directory, 'manifest.json'))
+        base_url = os.environ.get('CLIMATE_DATA_URL', climate_downloader.BASE_URL)
+        with instrumentation.stage('download') as stage:
+            try:
+                with climate_downloader.ClimateDownloader(base_url) as downloader:
+                    with futures.ThreadPoolExecutor(max_workers=downloader.concurrency) as executor:
+                        jobs = [executor.submit(download_data_for_station, downloader, manifest, k, v['start'], v['end'], code)
+                                for code, stations in provinces.items() for k, v in stations.items()]
+                        for job in futures.as_completed(jobs):
+                            job.result()
+                            stage.count('stations')
+            finally:
+                manifest.save()
+
+        process_provinces(provinces, processes=processes)
@@ -2,21 +2,23 @@ from enum import Enum, IntEnum
 import json
 from pydoc import describe
 import re
-from datetime import datetime
+from datetime import date, datetime
 import xml.etree.ElementTree as ET
 from os import path
 import os
+from collections import Counter
+import shutil
+import sys
 import csv
+from typing import NamedTuple
 import locale
+import catastrophe_clusters
+import catastrophe_store
+import instrumentation
 import utils
-import geojson
 from shapely import geometry
 import shapefile
 
-locale.setlocale(locale.LC_ALL, 'fr-CA.UTF-8')
-
-district_shapes = utils.load_map()
-
 class Severity(IntEnum):
     Unknown = 0
     Minor = 1
@@ -49,8 +51,23 @@ event_types = {
     "vague de chaleur": {"type": CatastropheType.HeatWave, "min_severity": Severity.Important}
 }
 
+class Catastrophe(NamedTuple):
+    id: str
+    location: tuple[float, float]
+    type: CatastropheType
+    date: date
+    severity: Severity
+    loc_approx: bool
+    city: str | None = None
+
 severity_pattern = re.compile(r'menace (\w+)', re.I)
 
+SHARD_DIRECTORY = 'catastrophes'
+# Nombre de deltas conservés pour les clients qui ont déjà des données
+MAX_DELTAS = 50
+# Coordonnées de l'export compact en millionièmes de degré
+COORDINATE_SCALE = 1000000
+
 
 def parse_old_severity(description):
     if description == 'EXTRAORDINAIRE' or description == 'EXTRÊME':
@@ -92,11 +109,9 @@ def parse_new_line(line):
     return None
 
 
-def parse_old_file(path, catastrophes):
-    with open(path, 'r', encoding='utf-8') as input_file:
-        event_collection = geojson.load(input_file)
-
-    for feature in event_collection['features']:
+def parse_old_file(path):
+    for feature in utils.iter_json_array(path, 'features'):
+        instrumentation.count('rows_read')
         properties = feature['properties']
         date = datetime.strptime(
             properties['date_observation'], '%Y/%m/%d %H:%M:%S')
@@ -105,24 +120,18 @@ def parse_old_file(path, catastrophes):
             if event:
                 severity = parse_old_severity(properties['severite'].upper())
                 if severity >= event['min_severity']:
-                    location = feature['geometry']['coordinates']
-                    catastrophe = {
-                        "id": str(properties['no_seq_observation']),
-                        "location": location,
-                        "city": properties['nom'],
-                        "type": event['type'],
-                        "date": date.date(),
-                        "severity": severity,
-                        "loc_approx": properties['imprecision'] == 'localisation'
-                    }
-                    catastrophes.append(catastrophe)
-
-
-def parse_new_file(path, catastrophes):
+                    # Même arrondi que geojson.load
+                    location = tuple(round(x, 6) for x in feature['geometry']['coordinates'])
+                    yield Catastrophe(str(properties['no_seq_observation']), location, event['type'], date.date(),
+                                      severity, properties['imprecision'] == 'localisation', properties['nom'])
+
+
+def parse_new_file(path):
     with open(path, 'r', encoding='utf-8') as input_file:
         reader = csv.reader(input_file)
         next(reader, None)
         for line in reader:
+            instrumentation.count('rows_read')
             code_alea, alea, code_municipalite, municipalite, precision_localisation, _, severite, date_signalement, date_debut, _, _, _, coord_x, coord_y = line
             event = event_types.get(alea.lower())
 
@@ -131,23 +140,17 @@ def parse_new_file(path, catastrophes):
                 if severity >= event['min_severity']:
                     date = datetime.strptime(
                         date_debut if date_debut else date_signalement, '%Y-%m-%d')
-                    catastrophe = {
-                        "id": "{}{}{}".format(code_alea, code_municipalite, date.date().strftime('%Y%m%d')),
-                        "location": [float(coord_x), float(coord_y)],
-                        "city": municipalite,
-                        "type": event['type'],
-                        "date": date.date(),
-                        "severity": severity,
-                        "loc_approx": precision_localisation.lower() == 'imprécise'
-                    }
-                    catastrophes.append(catastrophe)
-
-
-def parse_shp(path, catastrophes):
+                    yield Catastrophe("{}{}{}".format(code_alea, code_municipalite, date.date().strftime('%Y%m%d')),
+                                      (float(coord_x), float(coord_y)), event['type'], date.date(), severity,
+                                      precision_localisation.lower() == 'imprécise', municipalite)
+
+
+def parse_shp(path):
     forest_fire_type = event_types['feu de forêt']
     reader = shapefile.Reader(path)
-    for shape in reader.shapeRecords(['ANNEE', 'DATE_DEBUT', 'LATITUDE', 'LONGITUDE', 'CLE', 'SUP_HA']):
-        record = shape.record
+    # Seuls les attributs sont lus, les points sont déjà dans LATITUDE/LONGITUDE
+    for record in reader.iterRecords(['ANNEE', 'DATE_DEBUT', 'LATITUDE', 'LONGITUDE', 'CLE', 'SUP_HA']):
+        instrumentation.count('rows_read')
         if record.ANNEE >= utils.MIN_YEAR:
             severity = Severity.Unknown
             match record.SUP_HA:
@@ -161,78 +164,331 @@ def parse_shp(path, catastrophes):
                     severity = Severity.Extreme
 
             if severity >= forest_fire_type['min_severity']:
-                fire = {
-                    "id": str(int(record.CLE)),
-                    "location": [record.LONGITUDE, record.LATITUDE],
-                    "type": CatastropheType.ForestFire,
-                    "date": record.DATE_DEBUT,
-                    "severity": severity,
-                    'loc_approx': False
-                }
-                catastrophes.append(fire)
-
-
-def parse_heat_waves(path, catastrophes):
+                yield Catastrophe(str(int(record.CLE)), (record.LONGITUDE, record.LATITUDE), CatastropheType.ForestFire,
+                                  record.DATE_DEBUT, severity, False)
+
+
+def parse_heat_waves(path):
     heat_wave_type = event_types['vague de chaleur']
     with open(path, 'r', encoding='utf-8') as input_file:
         reader = csv.reader(input_file)
         next(reader, None)
         for line in reader:
+            instrumentation.count('rows_read')
             nom, station_id, lng, lat, raw_date, duration = line
             date = datetime.strptime(raw_date, '%Y-%m-%d')
             severity = Severity(max(Severity.Minor.value, min(Severity.Extreme.value, int(duration) - 3)))
             if severity >= heat_wave_type['min_severity']:
-                heat_wave = {
-                    "id": '{}_{}'.format(station_id, date.strftime('%Y%m%d')),
-                    "location": [float(lng), float(lat)],
-                    "type": CatastropheType.HeatWave,
-                    "date": date.date(),
-                    "severity": severity,
-                    'loc_approx': True
-                }
-                if nom:
-                    heat_wave['city'] = nom
-                catastrophes.append(heat_wave)
-
-
-catastrophes = []
-
-parse_old_file(path.join(utils.source_directory,
-               'catastrophes_pre2020.json'), catastrophes)
-parse_new_file(path.join(utils.source_directory,
-               'catastrophes_post2020.csv'), catastrophes)
-
-parse_shp(path.join(utils.source_directory, 'Feux_pt_ori', 'FEUX_PT_ORI_1972_2021.shp'), catastrophes)
-parse_heat_waves(path.join(utils.source_directory, 'heat_waves.csv'), catastrophes)
-
-catastrophes.sort(key=lambda x: x['date'])
-
-with open(path.join(utils.destination_directory, '..', '..', 'src', 'models', 'districts.json'), 'r', encoding='utf-8') as input_file:
-    all_districts: dict = json.load(input_file)
-
-result = {}
-for catastrophe in catastrophes:
+                yield Catastrophe('{}_{}'.format(station_id, date.strftime('%Y%m%d')), (float(lng), float(lat)),
+                                  CatastropheType.HeatWave, date.date(), severity, True, nom or None)
+
+
+# Sources dans l'ordre utilisé pour départager les événements d'une même date
+SOURCES = [
+    ('pre2020', parse_old_file, ['catastrophes_pre2020.json']),
+    ('post2020', parse_new_file, ['catastrophes_post2020.csv']),
+    ('feux', parse_shp, [path.join('Feux_pt_ori', 'FEUX_PT_ORI_1972_2021.shp'), path.join('Feux_pt_ori', 'FEUX_PT_ORI_1972_2021.dbf')]),
+    ('heat_waves', parse_heat_waves, ['heat_waves.csv'])
+]
+
+
+def ordinal_year(day: int) -> int:
+    return date.fromordinal(day).year
+
+
+def to_row(catastrophe: Catastrophe) -> tuple:
+    return (catastrophe.id, catastrophe.date.toordinal(), catastrophe.location[0], catastrophe.location[1],
+            catastrophe.type.value, catastrophe.severity.value, int(catastrophe.loc_approx), catastrophe.city)
+
+
+def from_row(row, all_districts: dict) -> tuple[Catastrophe, int, str | None]:
+    id, day, x, y, type, severity, loc_approx, city, district = row
+    catastrophe = Catastrophe(id, (x, y), CatastropheType(type), date.fromordinal(day), Severity(severity), bool(loc_approx), city)
+    if city is None and district is not None:
+        city = all_districts.get(str(district))
+    return catastrophe, 0 if district is None else district, city
+
+
+class CatastropheColumns:
+    # Export compact d'une année: une liste par attribut, types et villes remplacés par un index dans un dictionnaire,
+    # dates en jours depuis le 1er janvier et coordonnées en virgule fixe
+    def __init__(self, year: int):
+        self.start = date(year, 1, 1)
+        self.types: dict[str, int] = {}
+        self.cities: dict[str, int] = {}
+        self.columns: dict[str, list] = {x: [] for x in ['id', 'x', 'y', 'type', 'day', 'severity', 'district', 'loc_approx', 'city']}
+
+    def add(self, catastrophe: Catastrophe, district: int, city: str | None):
+        columns = self.columns
+        columns['id'].append(catastrophe.id)
+        columns['x'].append(round(catastrophe.location[0] * COORDINATE_SCALE))
+        columns['y'].append(round(catastrophe.location[1] * COORDINATE_SCALE))
+        columns['type'].append(self.types.setdefault(catastrophe.type.value, len(self.types)))
+        columns['day'].append((catastrophe.date - self.start).days)
+        columns['severity'].append(catastrophe.severity.value)
+        columns['district'].append(district)
+        columns['loc_approx'].append(int(catastrophe.loc_approx))
+        columns['city'].append(-1 if city is None else self.cities.setdefault(city, len(self.cities)))
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'start': self.start.isoformat(),
+            'scale': COORDINATE_SCALE,
+            'types': list(self.types),
+            'cities': list(self.cities),
+            **self.columns
+        }, ensure_ascii=False, separators=(',', ':'))
+
+
+class CatastropheWriter:
+    # Réécrit les fichiers des années demandées, les autres années sont reprises du manifeste existant
+    def __init__(self, by_district=False, compact=False, destination=utils.destination_directory):
+        self.by_district = by_district
+        self.compact = compact
+        self.destination = destination
+        self.directory = os.path.join(destination, SHARD_DIRECTORY)
+        self.manifest = self._read_json('manifest.json') or {'version': 1, 'total': 0, 'years': {}}
+        self.revision = self.manifest.get('revision', 0)
+        self.pointer = self._read_json('latest.json') or {'revision': self.revision, 'deltas': {}}
+        # Nombre d'événements par année, circonscription (0 pour tout le Québec), type et sévérité
+        self.counts = self._read_json('counts.json') or {'version': 1, 'years': {}}
+        # Changements depuis la révision précédente, None si elle a été entièrement réécrite
+        self.added: list[str] | None = []
+        self.removed: list[dict] | None = []
+
+    def _read_json(self, name):
+        try:
+            with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as input_file:
+                return json.load(input_file)
+        except (OSError, ValueError):
+            return None
+
+    def reset(self):
+        # Les clients devront tout recharger, les deltas précédents sont retirés
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.manifest = {'version': 1, 'total': 0, 'years': {}}
+        self.pointer = {'revision': self.revision, 'deltas': {}}
+        self.counts = {'version': 1, 'years': {}}
+        self.added = self.removed = None
+
+    def _previous_documents(self, year: str) -> Counter:
+        entry = self.manifest['years'].get(year)
+        if self.added is None or entry is None:
+            return Counter()
+        with open(os.path.join(self.destination, entry['file']), 'r', encoding='utf-8') as input_file:
+            return Counter(json.dumps(x) for x in json.load(input_file))
+
+    def _remove_year(self, year: str):
+        self.counts['years'].pop(year, None)
+        entry = self.manifest['years'].pop(year, None)
+        if entry is None:
+            return
+        for file in [entry['file'], entry.get('columns', {}).get('file'), entry.get('clusters', {}).get('file')]:
+            if file and os.path.isfile(os.path.join(self.destination, file)):
+                os.remove(os.path.join(self.destination, file))
+        shutil.rmtree(os.path.join(self.directory, year), ignore_errors=True)
+
+    def write_year(self, year: int, records):
+        # records: (événement, circonscription, ville) triés par date
+        key = str(year)
+        previous = self._previous_documents(key)
+        self._remove_year(key)
+        os.makedirs(self.directory, exist_ok=True)
+        relative_path = '{}/{}.json'.format(SHARD_DIRECTORY, key)
+        entry = {'file': relative_path, 'count': 0, 'bytes': 0}
+        texts = []
+        # Documents déjà sérialisés, par circonscription
+        districts: dict[int, list[str]] = {}
+        columns = CatastropheColumns(year) if self.compact else None
+        counts: dict[int, dict[CatastropheType, list[int]]] = {}
+        clusters = catastrophe_clusters.ClusterIndex()
+        with open(os.path.join(self.destination, relative_path), 'w', encoding='utf-8') as output_file:
+            output_file.write('[')
+            for catastrophe, district, city in records:
+                text = to_json(catastrophe, district, city)
+                if entry['count']:
+                    output_file.write(', ')
+                output_file.write(text)
+                entry['count'] += 1
+                texts.append(text)
+                if self.by_district:
+                    districts.setdefault(district, []).append(text)
+                if columns:
+                    columns.add(catastrophe, district, city)
+                clusters.add(catastrophe.location[0], catastrophe.location[1], catastrophe.type.value, text)
+                for count_district in {0, district}:
+                    by_type = counts.setdefault(count_district, {})
+                    by_type.setdefault(catastrophe.type, [0] * len(Severity))[catastrophe.severity] += 1
+            output_file.write(']')
+            entry['bytes'] = output_file.tell()
+
+        if self.added is not None:
+            added = Counter(texts) - previous
+            self.removed.extend(catastrophe_key(json.loads(x)) for x in (previous - Counter(texts)).elements())
+            for text in texts:
+                if added[text]:
+                    added[text] -= 1
+                    self.added.append(text)
+
+        if not entry['count']:
+            os.remove(os.path.join(self.destination, relative_path))
+            return
+        if self.by_district:
+            entry['districts'] = {str(district): self._write_district(key, district, documents)
+                                  for district, documents in sorted(districts.items())}
+        if columns:
+            entry['columns'] = self._write_columns(key, columns, entry['count'])
+        entry['clusters'] = self._write_clusters(key, clusters, entry['count'])
+        self.manifest['years'][key] = entry
+        instrumentation.count('bytes_written', entry['bytes'] + sum(
+            x['bytes'] for x in [entry.get('columns'), entry['clusters'], *entry.get('districts', {}).values()] if x))
+        self.counts['years'][key] = {str(district): {x.value: by_type[x] for x in CatastropheType if x in by_type}
+                                     for district, by_type in sorted(counts.items())}
+
+    def _write_district(self, year: str, district, documents: list[str]) -> dict:
+        relative_path = '{}/{}/{}.json'.format(SHARD_DIRECTORY, year, district)
+        full_path = os.path.join(self.destination, relative_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        data = '[{}]'.format(', '.join(documents))
+        with open(full_path, 'w', encoding='utf-8') as output_file:
+            output_file.write(data)
+        return {'file': relative_path, 'count': len(documents), 'bytes': len(data.encode('utf-8'))}
+
+    def _write_columns(self, year: str, columns: CatastropheColumns, count: int) -> dict:
+        relative_path = '{}/{}.columns.json'.format(SHARD_DIRECTORY, year)
+        data = columns.to_json().encode('utf-8')
+        with open(os.path.join(self.destination, relative_path), 'wb') as output_file:
+            output_file.write(data)
+        return {'file': relative_path, 'count': count, 'bytes': len(data)}
+
+    def _write_clusters(self, year: str, clusters: catastrophe_clusters.ClusterIndex, count: int) -> dict:
+        relative_path = '{}/{}.clusters.json'.format(SHARD_DIRECTORY, year)
+        data = clusters.to_json().encode('utf-8')
+        with open(os.path.join(self.destination, relative_path), 'wb') as output_file:
+            output_file.write(data)
+        return {'file': relative_path, 'count': count, 'bytes': len(data)}
+
+    def _write_delta(self):
+        # Un client à la révision précédente retire les documents « removed » puis ajoute les documents « added »
+        relative_path = '{}/deltas/{}.json'.format(SHARD_DIRECTORY, self.revision)
+        os.makedirs(os.path.join(self.directory, 'deltas'), exist_ok=True)
+        with open(os.path.join(self.destination, relative_path), 'w', encoding='utf-8') as output_file:
+            output_file.write('{{"from": {}, "to": {}, "added": [{}], "removed": {}}}'.format(
+                self.revision - 1, self.revision, ', '.join(self.added), json.dumps(self.removed)))
+        self.pointer['deltas'][str(self.revision)] = relative_path
+
+        for revision in [x for x in self.pointer['deltas'] if int(x) <= self.revision - MAX_DELTAS]:
+            old_path = os.path.join(self.destination, self.pointer['deltas'].pop(revision))
+            if os.path.isfile(old_path):
+                os.remove(old_path)
+
+    def close(self):
+        if self.added is None or self.added or self.removed:
+            self.revision += 1
+            if self.added is not None:
+                self._write_delta()
+        self.pointer['revision'] = self.revision
+        self.manifest['revision'] = self.revision
+
+        years = dict(sorted(self.manifest['years'].items()))
+        self.manifest['years'] = years
+        self.manifest['total'] = sum(x['count'] for x in years.values())
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'manifest.json'), 'w', encoding='utf-8') as output_file:
+            json.dump(self.manifest, output_file)
+        self.counts['years'] = dict(sorted(self.counts['years'].items()))
+        with open(os.path.join(self.directory, 'counts.json'), 'w', encoding='utf-8') as output_file:
+            json.dump(self.counts, output_file)
+        # Pointeur vers la dernière révision, à consulter sans cache
+        with open(os.path.join(self.directory, 'latest.json'), 'w', encoding='utf-8') as output_file:
+            json.dump(self.pointer, output_file)
+
+        # catastrophes.json est la concaténation des fichiers par année
+        with open(os.path.join(self.destination, 'catastrophes.json'), 'w', encoding='utf-8') as output_file:
+            output_file.write('{')
+            for i, (year, entry) in enumerate(years.items()):
+                output_file.write('{}{}: '.format(', ' if i else '', json.dumps(year)))
+                with open(os.path.join(self.destination, entry['file']), 'r', encoding='utf-8') as input_file:
+                    shutil.copyfileobj(input_file, output_file)
+            output_file.write('}')
+            instrumentation.count('bytes_written', output_file.tell())
+
+
+def catastrophe_key(document: dict) -> dict:
+    # Identifie un document d'une révision à l'autre
+    return {'id': document['id'], 'type': document['type'], 'date': document['date']}
+
+
+def to_json(catastrophe: Catastrophe, district: int, city: str | None) -> str:
+    # Même ordre de clés et même format que json.dump
     obj = {
-        'id': catastrophe['id'],
-        'location': catastrophe['location'],
-        'type': catastrophe['type'].value,
-        'date': catastrophe['date'].isoformat(),
-        'severity': catastrophe['severity'].value,
-        'district': 0,
-        'loc_approx': catastrophe['loc_approx']
+        'id': catastrophe.id,
+        'location': catastrophe.location,
+        'type': catastrophe.type.value,
+        'date': catastrophe.date.isoformat(),
+        'severity': catastrophe.severity.value,
+        'district': district,
+        'loc_approx': catastrophe.loc_approx
     }
-
-    district_id = utils.find_district(district_shapes, obj['location'])
-    if district_id is not None:
-        obj['district'] = district_id
-    if 'city' in catastrophe:
-        obj['city'] = catastrophe['city']
-    elif district_id is not None:
-        district_name = all_districts.get(str(district_id))
-        if district_name:
-            obj['city'] = district_name
-
-    result.setdefault(str(catastrophe['date'].year), []).append(obj)
-
-with open(os.path.join(utils.destination_directory, 'catastrophes.json'), 'w', encoding='utf-8') as output_file:
-    json.dump(result, output_file)
+    if city is not None:
+        obj['city'] = city
+    return json.dumps(obj)
+
+
+if __name__ == '__main__':
+    with instrumentation.run('generate_catastrophes'):
+        locale.setlocale(locale.LC_ALL, 'fr-CA.UTF-8')
+
+        options = sys.argv[1:]
+        # --province=XX: sources, carte et sorties de la province (utils.province_directories)
+        province = utils.parse_province(options)
+        source_directory, destination_directory, cache_directory = utils.province_directories(province)
+        map_path = utils.map_path(province)
+        districts_path = utils.district_names_path(province)
+        with open(districts_path, 'r', encoding='utf-8') as input_file:
+            all_districts: dict = json.load(input_file)
+
+        writer = CatastropheWriter('--district-shards' in options, '--compact' in options, destination_directory)
+        # Seules les sources modifiées sont relues et seules les années touchées sont réécrites
+        with catastrophe_store.CatastropheStore(path.join(cache_directory, 'catastrophes.sqlite')) as store:
+            version = utils.file_hash(path.realpath(__file__))
+            if store.get_meta('version') != version:
+                store.clear()
+                store.set_meta('version', version)
+
+            affected = set()
+            for rank, (source, parse, file_names) in enumerate(SOURCES):
+                file_paths = [path.join(source_directory, x) for x in file_names]
+                # Hors du Québec, les sources sont optionnelles: une source absente est vide
+                missing = province != utils.DEFAULT_PROVINCE and not all(path.isfile(x) for x in file_paths)
+                source_hash = '' if missing else utils.file_hash(*file_paths)
+                if store.get_meta('source:' + source) != source_hash:
+                    with instrumentation.stage(parse.__name__) as stage:
+                        rows = [] if missing else (to_row(x) for x in stage.counted(parse(file_paths[0])))
+                        affected |= store.upsert_source(source, rank, rows, ordinal_year)
+                    store.set_meta('source:' + source, source_hash)
+
+            map_hash = utils.file_hash(map_path)
+            output_key = json.dumps([utils.file_hash(districts_path), writer.by_district, writer.compact])
+            map_changed = store.get_meta('map') != map_hash
+            if map_changed:
+                store.reset_districts()
+                store.set_meta('map', map_hash)
+            if map_changed or store.get_meta('output') != output_key or not writer.manifest['years']:
+                writer.reset()
+                affected = set(store.years())
+                store.set_meta('output', output_key)
+
+            unlocated = store.unlocated()
+            if unlocated:
+                with instrumentation.stage('locate_districts') as stage:
+                    stage.count('rows_read', len(unlocated))
+                    district_locator = utils.DistrictLocator(utils.load_map(map_path))
+                    districts = [(source, id, district_locator.locate((x, y))) for source, id, x, y in unlocated]
+                    stage.count('rows_kept', sum(1 for x in districts if x[2] is not None))
+                    store.set_districts(districts)
+
+            with instrumentation.stage('write_years') as stage:
+                for year in sorted(affected):
+                    writer.write_year(year, (from_row(x, all_districts) for x in stage.counted(store.records(year), 'rows_read')))
+                writer.close()
@@ -2,33 +2,134 @@ import frontmatter
 import os
 import json
 import re
+from concurrent import futures
+import bs4
+import markdown
 import utils
 
 LOCATION_PATTERN = re.compile('(-?\d+\.\d+)')
 
-highlights = []
 root_path = os.path.join(utils.source_directory, 'highlights')
-for name in os.listdir(root_path):
-    full_path = os.path.join(root_path, name)
-    if os.path.isfile(full_path):
-        with open(full_path, 'r', encoding='utf-8') as input_file:
-            file = frontmatter.load(input_file)
-
-            location = LOCATION_PATTERN.findall(file.metadata['location'])
-            highlight = {
-                'id': os.path.splitext(name)[0],
-                'year': int(file.metadata['year']),
-                'location': {
-                    'lat': float(location[0]),
-                    'lng': float(location[1])
-                },
-                'locale': file.metadata['locale'],
-                'type': file.metadata['type'] if 'type' in file.metadata else 'UNKNOWN',
-                'body': file.content
-            }
-            if 'title' in file.metadata:
-                highlight['title'] = file.metadata['title']
-            highlights.append(highlight)
-
-with open(os.path.join(utils.destination_directory, 'highlights.json'), 'w', encoding='utf-8') as output_file:
-    json.dump(highlights, output_file)
+# Un index par langue (highlights/<langue>.json) et le texte HTML de chaque fait saillant, chargé à l'ouverture
+output_directory = os.path.join(utils.destination_directory, 'highlights')
+
+# Balises et attributs conservés dans le HTML généré, tout le reste est retiré
+ALLOWED_TAGS = {'p', 'br', 'strong', 'em', 'a', 'ul', 'ol', 'li', 'blockquote', 'code', 'h1', 'h2', 'h3', 'h4'}
+ALLOWED_ATTRIBUTES = {'a': {'href', 'title'}}
+ALLOWED_SCHEMES = {'http', 'https', 'mailto'}
+SCHEME_PATTERN = re.compile(r'([a-zA-Z][a-zA-Z0-9+.-]*):')
+# Balises retirées avec leur contenu
+REMOVED_TAGS = {'script', 'style', 'iframe', 'object', 'embed'}
+# En deçà, les fichiers modifiés sont analysés sans lancer de processus
+PARALLEL_THRESHOLD = 16
+
+
+def sanitize(html: str) -> str:
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    for tag in soup.find_all(True):
+        if tag.name in REMOVED_TAGS:
+            tag.decompose()
+        elif tag.name not in ALLOWED_TAGS:
+            tag.unwrap()
+        else:
+            allowed = ALLOWED_ATTRIBUTES.get(tag.name, set())
+            tag.attrs = {k: v for k, v in tag.attrs.items() if k in allowed}
+    for link in soup.find_all('a'):
+        # Les navigateurs ignorent les espaces et caractères de contrôle d'une adresse, ex.: "java\tscript:"
+        scheme = SCHEME_PATTERN.match(re.sub(r'[\x00-\x20]', '', link.get('href', '')))
+        if scheme and scheme.group(1).lower() not in ALLOWED_SCHEMES:
+            del link['href']
+        # Les liens s'ouvrent dans un nouvel onglet, comme le faisait le rendu dans le navigateur
+        link['target'] = '_blank'
+        link['rel'] = 'noopener noreferrer'
+    return str(soup)
+
+
+def render(body: str) -> str:
+    # nl2br: un saut de ligne devient <br>, comme l'option breaks de marked
+    return sanitize(markdown.markdown(body, extensions=['nl2br'], output_format='html'))
+
+
+def parse_highlight(full_path) -> dict:
+    with open(full_path, 'r', encoding='utf-8') as input_file:
+        file = frontmatter.load(input_file)
+
+    location = LOCATION_PATTERN.findall(file.metadata['location'])
+    highlight = {
+        'id': os.path.splitext(os.path.basename(full_path))[0],
+        'year': int(file.metadata['year']),
+        'location': {
+            'lat': float(location[0]),
+            'lng': float(location[1])
+        },
+        'locale': file.metadata['locale'],
+        'type': file.metadata['type'] if 'type' in file.metadata else 'UNKNOWN',
+        'body': render(file.content)
+    }
+    if 'title' in file.metadata:
+        highlight['title'] = file.metadata['title']
+    return highlight
+
+
+def load_highlights(processes=None) -> list[dict]:
+    # Les fichiers dont le contenu n'a pas changé depuis la dernière exécution ne sont pas relus. Le cache est
+    # invalidé lorsque ce script change, puisque le rendu peut en dépendre
+    cache_key = utils.file_hash(os.path.realpath(__file__))
+    cached = utils.read_cache('highlights', cache_key) or {}
+    # Ordre stable d'un système de fichiers à l'autre
+    names = [x for x in sorted(os.listdir(root_path)) if os.path.isfile(os.path.join(root_path, x))]
+    hashes = {x: utils.file_hash(os.path.join(root_path, x)) for x in names}
+    changed = [x for x in names if x not in cached or cached[x][0] != hashes[x]]
+
+    paths = [os.path.join(root_path, x) for x in changed]
+    if len(changed) < PARALLEL_THRESHOLD:
+        parsed = [parse_highlight(x) for x in paths]
+    else:
+        with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            parsed = list(executor.map(parse_highlight, paths, chunksize=8))
+    cached = {x: cached[x] for x in names if x in cached}
+    cached.update({name: (hashes[name], highlight) for name, highlight in zip(changed, parsed)})
+    utils.write_cache('highlights', cache_key, cached)
+    return [cached[x][1] for x in names]
+
+
+def write_if_changed(file_path, content: str):
+    # Un fichier inchangé garde sa date de modification
+    try:
+        with open(file_path, 'r', encoding='utf-8') as input_file:
+            if input_file.read() == content:
+                return
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8') as output_file:
+        output_file.write(content)
+
+
+def write_highlights(highlights: list[dict]):
+    indexes = {}
+    written = set()
+    for highlight in highlights:
+        entry = {k: v for k, v in highlight.items() if k != 'body'}
+        entry['file'] = 'highlights/{}/{}.html'.format(highlight['locale'], highlight['id'])
+        indexes.setdefault(highlight['locale'], []).append(entry)
+        file_path = os.path.join(utils.destination_directory, entry['file'])
+        write_if_changed(file_path, highlight['body'])
+        written.add(os.path.normpath(file_path))
+
+    for locale, entries in indexes.items():
+        file_path = os.path.join(output_directory, '{}.json'.format(locale))
+        write_if_changed(file_path, json.dumps(entries))
+        written.add(os.path.normpath(file_path))
+
+    # Retire les fichiers des faits saillants et des langues supprimés
+    for folder, directories, names in os.walk(output_directory, topdown=False):
+        for name in names:
+            if os.path.normpath(os.path.join(folder, name)) not in written:
+                os.remove(os.path.join(folder, name))
+        if not os.listdir(folder):
+            os.rmdir(folder)
+
+
+if __name__ == '__main__':
+    write_highlights(load_highlights())
@@ -1,39 +1,13 @@
 import json
-import csv
+import sys
 from os import path
-import re
+import numpy as np
+import climate_statistics
+import station_indicators
 import utils
 import os
 
 
-number_pattern = re.compile('(\d+)')
-
-
-def parse_header(header):
-    match = number_pattern.search(header)
-    if match:
-        return int(match.group(1), 10)
-    return 0
-
-
-def collect_statistics(name):
-    result = {}
-    with open(path.join(utils.source_directory, '{}.csv'.format(name)), encoding='utf-8') as input_file:
-        reader = csv.reader(input_file)
-
-        headers = [parse_header(x) for x in next(reader, None)[1:]]
-
-        for line in reader:
-            match = number_pattern.search(line[0])
-            if match:
-                values = {}
-                for i, v in enumerate(line[1:]):
-                    if v:
-                        values[headers[i]] = float(v)
-                result[int(match.group(1))] = values
-    return result
-
-
 stat_files = {
     'avg_temp': ['temperatures_moy_regions', 'temperatures_moy_circs'],
     'avg_prec': ['precipitations_moy_regions', 'precipitations_moy_circs'],
@@ -41,34 +15,78 @@ stat_files = {
     'days_below_min_25': ['nb_jours_moins_25_deg_regions', 'nb_jours_moins_25_deg_circs']
 }
 
-result = {}
-
-for prop, file_names in stat_files.items():
-    for file_name in file_names:
-        for year, statistics in collect_statistics(file_name).items():
-            for_year: dict = result.setdefault(year, {})
-            for region, value in statistics.items():
-                for_region = for_year.setdefault(str(region), {})
-                for_region[prop] = value
-
-ref_year = result[utils.MIN_YEAR]
-
-all_stats = {}
-first_above_1_5 = {}
-
-for year, data in result.items():
-    for region, statistics in data.items():
-        if region in ref_year:
-            temp_delta = statistics['avg_temp'] - \
-                ref_year[region]['avg_temp']
-            statistics['temp_delta'] = temp_delta
-            if region not in first_above_1_5 and temp_delta >= 1.5:
-                first_above_1_5[region] = year
-    all_stats[str(year)] = data
-
-output = {
-    'statistics': all_stats,
-    'over_target': first_above_1_5
-}
-with open(os.path.join(utils.destination_directory, 'statistics.json'), 'w', encoding='utf-8') as output_file:
-    json.dump(output, output_file)
+# Écart de température à partir duquel une région a atteint la cible de l'Accord de Paris
+TARGET_DELTA = 1.5
+# Nombre d'années à partir de MIN_YEAR dont la moyenne sert de référence pour temp_delta
+DEFAULT_BASELINE_YEARS = 1
+
+
+def load_cube(province=utils.DEFAULT_PROVINCE) -> climate_statistics.StatisticsCube:
+    source_directory = utils.province_directories(province)[0]
+    cube = climate_statistics.StatisticsCube(list(stat_files) + ['temp_delta'])
+    for prop, file_names in stat_files.items():
+        for file_name in file_names:
+            file_path = path.join(source_directory, '{}.csv'.format(file_name))
+            # Hors du Québec, les tables fournies sont optionnelles: les indicateurs des stations peuvent suffire
+            if province != utils.DEFAULT_PROVINCE and not path.isfile(file_path):
+                continue
+            cube.add(prop, *climate_statistics.read_table(file_path))
+    # Les indicateurs calculés à partir des stations (station_indicators.py) complètent les tables fournies
+    for prop, (file_name, _) in station_indicators.INDICATORS.items():
+        file_path = path.join(source_directory, '{}.csv'.format(file_name))
+        if path.isfile(file_path):
+            cube.add(prop, *climate_statistics.read_table(file_path), replace=False)
+    return cube
+
+
+def to_json(cube: climate_statistics.StatisticsCube, over_target: dict, trends: dict) -> dict:
+    years = cube.year_list().tolist()
+    regions = cube.region_list()
+    # None pour les valeurs absentes, qui sont omises
+    values = np.where(np.isnan(cube.values), None, cube.values).tolist()
+    all_stats = {}
+    for year, for_year in zip(years, values):
+        data = {}
+        for region, for_region in zip(regions, for_year):
+            statistics = {prop: x for prop, x in zip(cube.metrics, for_region) if x is not None}
+            if statistics:
+                data[region] = statistics
+        all_stats[str(year)] = data
+    return {
+        'statistics': all_stats,
+        'over_target': over_target,
+        'trends': trends
+    }
+
+
+if __name__ == '__main__':
+    options = dict(x[2:].split('=', 1) for x in sys.argv[1:] if x.startswith('--') and '=' in x)
+    baseline_years = int(options.get('baseline-years', DEFAULT_BASELINE_YEARS))
+    province = utils.parse_province(sys.argv[1:])
+    destination_directory = utils.province_directories(province)[1]
+
+    cube = load_cube(province)
+    if not cube.regions:
+        # Ni table fournie ni indicateurs des stations (ex.: province sans carte): les statistiques sont vides
+        print('{}: aucune statistique climatique disponible'.format(province), file=sys.stderr)
+    baseline = cube.baseline('avg_temp', utils.MIN_YEAR, utils.MIN_YEAR + baseline_years - 1)
+    deltas = cube.metric('avg_temp') - baseline
+    cube.metric('temp_delta')[:] = deltas
+
+    # Régions dans l'ordre de l'année où la cible est atteinte
+    years = cube.year_list()
+    regions = cube.region_list()
+    crossing, reached = climate_statistics.first_crossing(deltas, TARGET_DELTA)
+    order = [x for x in np.lexsort((np.arange(len(regions)), crossing)) if reached[x]]
+    over_target = {regions[x]: int(years[crossing[x]]) for x in order}
+
+    # Tendance par région et par indicateur, en unités par décennie
+    trends = {}
+    for prop in stat_files:
+        for region, slope in zip(regions, (cube.trend(prop) * 10).tolist()):
+            if not np.isnan(slope):
+                trends.setdefault(region, {})[prop] = round(slope, 4)
+
+    os.makedirs(destination_directory, exist_ok=True)
+    with open(os.path.join(destination_directory, 'statistics.json'), 'w', encoding='utf-8') as output_file:
+        json.dump(to_json(cube, over_target, trends), output_file)
@@ -0,0 +1,75 @@
+import csv
+import os
+import sys
+from concurrent import futures
+import numpy as np
+import utils
+import climate_archive
+import climate_stations
+
+# (température maximale minimale en °C, durée minimale en jours)
+DEFAULT_DEFINITION = (30.0, 3)
+
+
+def detect_heat_waves(days: np.ndarray, max_temps: np.ndarray, definitions) -> list[list[tuple[int, int]]]:
+    readings = ~np.isnan(max_temps)
+    days = np.asarray(days)[readings]
+    max_temps = np.asarray(max_temps)[readings]
+
+    # Une journée compte seulement si la lecture précédente date de la veille
+    consecutive = np.zeros(len(days), dtype=bool)
+    consecutive[1:] = np.diff(days) <= 1
+
+    result = []
+    for threshold, duration in definitions:
+        hot = consecutive & (max_temps >= threshold)
+        edges = np.diff(np.concatenate(([0], hot.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        lengths = np.flatnonzero(edges == -1) - starts
+        kept = lengths >= duration
+        result.append(list(zip(days[starts[kept]].tolist(), lengths[kept].tolist())))
+    return result
+
+
+def detect_station(archive_directory, station_id, definitions):
+    archive = climate_archive.ClimateArchive(archive_directory)
+    data = archive.load(station_id, ['date', 'max_temp'])
+    return detect_heat_waves(data['date'], data['max_temp'], definitions)
+
+
+def definition_file_name(definition):
+    if definition == DEFAULT_DEFINITION:
+        return 'heat_waves.csv'
+    return 'heat_waves_{:g}deg_{}j.csv'.format(*definition)
+
+
+def write_heat_waves(stations: dict[str, dict], definitions=(DEFAULT_DEFINITION,), archive_directory=climate_archive.archive_directory,
+                     destination=utils.source_directory, processes=None, executor: futures.Executor = None):
+    # executor: groupe de processus partagé entre plusieurs appels, ex.: une province à la fois
+    if executor is None:
+        with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            return write_heat_waves(stations, definitions, archive_directory, destination, executor=executor)
+
+    station_ids = list(stations.keys())
+    results = list(executor.map(detect_station, [archive_directory] * len(station_ids), station_ids,
+                                [definitions] * len(station_ids), chunksize=16))
+
+    for i, definition in enumerate(definitions):
+        with open(os.path.join(destination, definition_file_name(definition)), 'w', encoding='utf-8', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(['Nom','Longitude','Latitude','Date de départ','Durée en jours'])
+            for station_id, heat_waves in zip(station_ids, results):
+                station = stations[station_id]
+                for day, length in heat_waves[i]:
+                    writer.writerow([station['name'], station_id, station['loc'][0], station['loc'][1], climate_archive.from_day(day).strftime('%Y-%m-%d'), length])
+
+
+def parse_definition(value: str):
+    threshold, duration = value.split(':')
+    return (float(threshold), int(duration))
+
+
+if __name__ == '__main__':
+    # Définitions additionnelles optionnelles, ex.: python heat_waves.py 33:2
+    definitions = [DEFAULT_DEFINITION] + [parse_definition(x) for x in sys.argv[1:]]
+    write_heat_waves(climate_stations.load_stations(), definitions)
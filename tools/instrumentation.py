@@ -0,0 +1,168 @@
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from os import path
+import utils
+
+try:
+    import resource
+except ImportError:
+    # Absent sous Windows: la mémoire résidente n'est pas mesurée
+    resource = None
+
+# Rapports des exécutions, un fichier JSON par exécution
+reports_directory = path.join(utils.cache_directory, 'reports')
+# TOOLS_TRACEMALLOC=1 mesure le pic de mémoire Python de chaque étape (ralentit l'exécution),
+# TOOLS_PROFILE=1 enregistre un profil cProfile de l'exécution à côté du rapport
+TRACEMALLOC_VARIABLE = 'TOOLS_TRACEMALLOC'
+PROFILE_VARIABLE = 'TOOLS_PROFILE'
+
+
+def max_rss() -> dict[str, int]:
+    if resource is None:
+        return {}
+    # ru_maxrss est en kilo-octets sous Linux et en octets sous macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        # Processus enfants terminés, ex.: ProcessPoolExecutor
+        'max_children_rss_bytes': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    }
+
+
+class Stage:
+    def __init__(self, name, parent: 'Stage | None'):
+        self.name = name
+        self.parent = parent
+        self.counters: dict[str, int] = {}
+        self.result: dict = {}
+        self._peak = 0
+
+    def count(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def counted(self, items, counter='rows_kept'):
+        for item in items:
+            self.count(counter)
+            yield item
+
+    def to_json(self) -> dict:
+        counters = dict(self.counters)
+        if 'rows_read' in counters and 'rows_kept' in counters:
+            counters.setdefault('rows_dropped', counters['rows_read'] - counters['rows_kept'])
+        return {'name': self.name, 'parent': self.parent.name if self.parent else None, **self.result, **counters}
+
+
+class RunReport:
+    def __init__(self, script):
+        self.script = script
+        self.started = datetime.now()
+        self.start_time = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.stages: list[Stage] = []
+        self.active: list[Stage] = []
+        self.status = 'running'
+        name = '{}-{}'.format(script, self.started.strftime('%Y%m%d-%H%M%S'))
+        self.path = path.join(reports_directory, name + '.json')
+        self.profile_path = path.join(reports_directory, name + '.prof')
+        self.profiler = cProfile.Profile() if os.environ.get(PROFILE_VARIABLE) else None
+        self.tracing = bool(os.environ.get(TRACEMALLOC_VARIABLE))
+
+    @contextmanager
+    def stage(self, name):
+        stage = Stage(name, self.active[-1] if self.active else None)
+        if self.tracing:
+            # Le pic atteint jusqu'ici par les étapes englobantes est conservé avant d'être remis à zéro
+            peak = tracemalloc.get_traced_memory()[1]
+            for active in self.active:
+                active._peak = max(active._peak, peak)
+            tracemalloc.reset_peak()
+        self.active.append(stage)
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield stage
+        finally:
+            stage.result = {
+                'wall_seconds': round(time.perf_counter() - start, 4),
+                'cpu_seconds': round(time.process_time() - start_cpu, 4),
+                **max_rss()
+            }
+            if self.tracing:
+                # Le pic d'une étape englobe celui des étapes qu'elle contient
+                stage._peak = max(stage._peak, tracemalloc.get_traced_memory()[1])
+                stage.result['peak_traced_bytes'] = stage._peak
+                if stage.parent:
+                    stage.parent._peak = max(stage.parent._peak, stage._peak)
+            self.active.pop()
+            self.stages.append(stage)
+            # Réécrit après chaque étape: une exécution interrompue laisse un rapport partiel
+            self.write()
+
+    def to_json(self) -> dict:
+        return {
+            'script': self.script,
+            'argv': sys.argv[1:],
+            'started': self.started.isoformat(timespec='seconds'),
+            'status': self.status,
+            'wall_seconds': round(time.perf_counter() - self.start_time, 4),
+            'cpu_seconds': round(time.process_time() - self.start_cpu, 4),
+            **max_rss(),
+            'stages': [x.to_json() for x in self.stages]
+        }
+
+    def write(self):
+        os.makedirs(reports_directory, exist_ok=True)
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as output_file:
+            json.dump(self.to_json(), output_file, indent=1)
+        os.replace(self.path + '.tmp', self.path)
+
+
+_report: RunReport | None = None
+
+
+@contextmanager
+def run(script):
+    # Active les mesures pour l'exécution d'un script; les étapes hors d'une exécution ne sont pas mesurées
+    global _report
+    report = RunReport(script)
+    _report = report
+    if report.tracing:
+        tracemalloc.start()
+    if report.profiler:
+        report.profiler.enable()
+    try:
+        yield report
+        report.status = 'completed'
+    except BaseException:
+        report.status = 'failed'
+        raise
+    finally:
+        if report.profiler:
+            report.profiler.disable()
+            os.makedirs(reports_directory, exist_ok=True)
+            report.profiler.dump_stats(report.profile_path)
+        if report.tracing:
+            tracemalloc.stop()
+        report.write()
+        _report = None
+
+
+@contextmanager
+def stage(name):
+    if _report is None:
+        yield Stage(name, None)
+    else:
+        with _report.stage(name) as current:
+            yield current
+
+
+def count(counter, amount=1):
+    # Ajoute au compteur de l'étape en cours, sans effet hors d'une étape
+    if _report is not None and _report.active:
+        _report.active[-1].count(counter, amount)
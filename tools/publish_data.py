@@ -0,0 +1,71 @@
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import utils
+
+# Fichiers chargés par le site, relatifs à public/data
+DATASETS = [
+    'candidates.json',
+    'highlights/*.json',
+    'highlights/*/*.html',
+    'statistics.json',
+    'carte_electorale_niveaux.json',
+    'carte_electorale_*.topo.json',
+    'catastrophes/**/*.json'
+]
+# Fichiers toujours chargés sous leur nom d'origine: le pointeur de révision et les deltas qu'il référence
+EXCLUDED = ['catastrophes/latest.json', 'catastrophes/deltas/*']
+# Copies dont le nom contient l'empreinte du contenu, pouvant être mises en cache indéfiniment
+HASHED_DIRECTORY = 'v'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+
+
+def hashed_name(relative_path, content: bytes) -> str:
+    stem, extension = os.path.splitext(relative_path)
+    return '{}/{}.{}{}'.format(HASHED_DIRECTORY, stem, hashlib.sha256(content).hexdigest()[:HASH_LENGTH], extension)
+
+
+def dataset_files(directory) -> list[str]:
+    files = set()
+    for pattern in DATASETS:
+        for full_path in glob.glob(os.path.join(directory, pattern), recursive=True):
+            relative_path = os.path.relpath(full_path, directory).replace(os.sep, '/')
+            if not any(fnmatch.fnmatch(relative_path, x) for x in EXCLUDED):
+                files.add(relative_path)
+    return sorted(files)
+
+
+def publish(directory=utils.destination_directory) -> dict:
+    files = {}
+    for relative_path in dataset_files(directory):
+        with open(os.path.join(directory, relative_path), 'rb') as input_file:
+            content = input_file.read()
+        target = hashed_name(relative_path, content)
+        target_path = os.path.join(directory, target)
+        if not os.path.isfile(target_path):
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            with open(target_path, 'wb') as output_file:
+                output_file.write(content)
+        files[relative_path] = {'file': target, 'bytes': len(content)}
+
+    # Retire les copies qui ne correspondent plus à aucun fichier
+    expected = {os.path.normpath(os.path.join(directory, x['file'])) for x in files.values()}
+    for folder, directories, names in os.walk(os.path.join(directory, HASHED_DIRECTORY), topdown=False):
+        for name in names:
+            if os.path.normpath(os.path.join(folder, name)) not in expected:
+                os.remove(os.path.join(folder, name))
+        if not os.listdir(folder):
+            os.rmdir(folder)
+
+    manifest = {'version': 1, 'files': files}
+    with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as output_file:
+        json.dump(manifest, output_file, sort_keys=True)
+    return manifest
+
+
+if __name__ == '__main__':
+    manifest = publish()
+    print('{} files published'.format(len(manifest['files'])))
@@ -0,0 +1,341 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import sys
+from http import HTTPStatus
+from urllib import parse
+import numpy as np
+import climate_statistics
+import utils
+
+# Service HTTP en lecture seule sur les fichiers générés dans public/data, optionnel: le site n'en dépend pas.
+# Les fichiers sont rechargés lorsque les scripts de génération les réécrivent
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8081
+# Intervalle en secondes entre deux vérifications des fichiers surveillés
+RELOAD_INTERVAL = 2.0
+# Délai d'inactivité en secondes avant de fermer une connexion persistante
+KEEP_ALIVE_TIMEOUT = 15.0
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+# Les réponses plus petites ne sont pas compressées
+MIN_COMPRESSED_SIZE = 1024
+
+
+class QueryError(ValueError):
+    pass
+
+
+def int_parameter(query: dict[str, list[str]], name, default=None) -> int | None:
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return int(values[-1])
+    except ValueError:
+        raise QueryError('{} doit être un entier'.format(name))
+
+
+def list_parameter(query: dict[str, list[str]], name) -> list[str]:
+    # Valeurs répétées (?type=A&type=B) ou séparées par des virgules (?type=A,B)
+    return [x for values in query.get(name, []) for x in values.split(',') if x]
+
+
+def bbox_parameter(query: dict[str, list[str]]) -> tuple[float, float, float, float] | None:
+    values = list_parameter(query, 'bbox')
+    if not values:
+        return None
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(x) for x in values)
+    except ValueError:
+        raise QueryError('bbox doit être min_lng,min_lat,max_lng,max_lat')
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def page(query: dict[str, list[str]], total: int) -> tuple[int, int]:
+    offset = int_parameter(query, 'offset', 0)
+    limit = int_parameter(query, 'limit', DEFAULT_LIMIT)
+    if offset < 0 or not 0 <= limit <= MAX_LIMIT:
+        raise QueryError('offset doit être positif et limit compris entre 0 et {}'.format(MAX_LIMIT))
+    return min(offset, total), limit
+
+
+def paginated(path, query: dict[str, list[str]], items: list, total: int, offset: int, limit: int) -> dict:
+    result = {'total': total, 'offset': offset, 'limit': limit, 'items': items}
+    if limit and offset + limit < total:
+        following = dict(query, offset=[str(offset + limit)])
+        result['next'] = '{}?{}'.format(path, parse.urlencode(following, doseq=True))
+    return result
+
+
+class CatastropheIndex:
+    # Événements de toutes les années en colonnes NumPy, triés par année comme dans le manifeste. Les positions de
+    # chaque circonscription sont conservées à part; le type et l'étendue sont filtrés sur la tranche retenue
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+        self.years = np.array([int(x['date'][:4]) for x in documents], dtype=np.int32)
+        self.districts = np.array([x.get('district') or 0 for x in documents], dtype=np.int32)
+        type_names, self.types = np.unique([x['type'] for x in documents], return_inverse=True)
+        self.type_codes = {x: i for i, x in enumerate(type_names.tolist())}
+        locations = np.array([x['location'] for x in documents], dtype=np.float64).reshape(len(documents), 2)
+        self.lng, self.lat = locations[:, 0], locations[:, 1]
+
+        order = np.argsort(self.districts, kind='stable')
+        districts, starts = np.unique(self.districts[order], return_index=True)
+        self.by_district = dict(zip(districts.tolist(), np.split(order, starts[1:])))
+
+    def query(self, first_year=None, last_year=None, district=None, types=None, bbox=None) -> np.ndarray:
+        start = 0 if first_year is None else np.searchsorted(self.years, first_year, side='left')
+        end = len(self.years) if last_year is None else np.searchsorted(self.years, last_year, side='right')
+        if district is None:
+            positions = np.arange(start, end)
+        else:
+            positions = self.by_district.get(district, np.empty(0, dtype=np.intp))
+            positions = positions[np.searchsorted(positions, start):np.searchsorted(positions, end)]
+        if types:
+            codes = [self.type_codes[x] for x in types if x in self.type_codes]
+            positions = positions[np.isin(self.types[positions], codes)]
+        if bbox:
+            min_lng, min_lat, max_lng, max_lat = bbox
+            lng, lat = self.lng[positions], self.lat[positions]
+            positions = positions[(lng >= min_lng) & (lng <= max_lng) & (lat >= min_lat) & (lat <= max_lat)]
+        return positions
+
+
+def load_catastrophes(manifest_path) -> tuple[bytes, CatastropheIndex]:
+    # Le manifeste est écrit en dernier par generate_catastrophes.py: il identifie la version des fichiers
+    with open(manifest_path, 'rb') as input_file:
+        content = input_file.read()
+    manifest = json.loads(content)
+    # Les chemins du manifeste sont relatifs au répertoire parent, public/data
+    directory = os.path.dirname(os.path.dirname(manifest_path))
+    documents = []
+    for year, entry in sorted(manifest['years'].items(), key=lambda x: int(x[0])):
+        with open(os.path.join(directory, entry['file']), 'r', encoding='utf-8') as input_file:
+            documents.extend(json.load(input_file))
+    return content, CatastropheIndex(documents)
+
+
+def load_statistics(statistics_path) -> tuple[bytes, climate_statistics.StatisticsCube]:
+    with open(statistics_path, 'rb') as input_file:
+        content = input_file.read()
+    statistics = json.loads(content)['statistics']
+    years = [int(x) for x in statistics]
+    regions = list(dict.fromkeys(region for for_year in statistics.values() for region in for_year))
+    metrics = list(dict.fromkeys(x for for_year in statistics.values() for values in for_year.values() for x in values))
+    cube = climate_statistics.StatisticsCube(metrics)
+    region_index = {x: i for i, x in enumerate(regions)}
+    for metric in metrics:
+        table = np.full((len(years), len(regions)), np.nan)
+        for row, for_year in enumerate(statistics.values()):
+            for region, values in for_year.items():
+                if metric in values:
+                    table[row, region_index[region]] = values[metric]
+        cube.add(metric, years, regions, table)
+    return content, cube
+
+
+class Dataset:
+    # Fichier surveillé et index construit à partir de celui-ci. La version et l'index sont remplacés d'un bloc: une
+    # requête en cours garde les précédents. Un fichier illisible (ex.: en cours d'écriture) est ignoré jusqu'à sa
+    # prochaine modification
+    def __init__(self, name, file_path, load):
+        self.name = name
+        self.path = file_path
+        self.load = load
+        self.current: tuple[str, object] | None = None
+        self.stat = None
+
+    def file_stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        return self.file_stat() != self.stat
+
+    def reload(self):
+        self.stat = self.file_stat()
+        try:
+            content, index = self.load(self.path)
+        except (OSError, ValueError, KeyError) as e:
+            print('{}: {}'.format(self.name, e), file=sys.stderr)
+            return
+        version = hashlib.sha256(content).hexdigest()[:16]
+        self.current = version, index
+        print('{}: version {} chargée'.format(self.name, version), file=sys.stderr)
+
+
+class QueryService:
+    def __init__(self, directory=utils.destination_directory):
+        self.catastrophes = Dataset('catastrophes', os.path.join(directory, 'catastrophes', 'manifest.json'),
+                                    load_catastrophes)
+        self.statistics = Dataset('statistics', os.path.join(directory, 'statistics.json'), load_statistics)
+        self.datasets = [self.catastrophes, self.statistics]
+        self.routes = {
+            '/': (None, self.query_status),
+            '/catastrophes': (self.catastrophes, self.query_catastrophes),
+            '/statistics': (self.statistics, self.query_statistics)
+        }
+
+    def load(self):
+        for dataset in self.datasets:
+            dataset.reload()
+
+    async def watch(self, interval=RELOAD_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            for dataset in self.datasets:
+                if dataset.changed():
+                    await asyncio.to_thread(dataset.reload)
+
+    def query_status(self, versions: dict[str, str], path, query) -> dict:
+        return versions
+
+    def query_catastrophes(self, index: CatastropheIndex, path, query) -> dict:
+        # ex.: /catastrophes?from=2000&to=2010&district=250&type=FLOOD
+        positions = index.query(int_parameter(query, 'from'), int_parameter(query, 'to'),
+                                int_parameter(query, 'district'), list_parameter(query, 'type'), bbox_parameter(query))
+        offset, limit = page(query, len(positions))
+        items = [index.documents[x] for x in positions[offset:offset + limit].tolist()]
+        return paginated(path, query, items, len(positions), offset, limit)
+
+    def query_statistics(self, cube: climate_statistics.StatisticsCube, path, query) -> dict:
+        # Une ligne par année et par région, ex.: /statistics?region=0,250&from=1990&to=2000&metric=avg_temp
+        metrics = list_parameter(query, 'metric') or cube.metrics
+        unknown = [x for x in metrics if x not in cube.metrics]
+        if unknown:
+            raise QueryError('indicateurs inconnus: {}'.format(', '.join(unknown)))
+        years = cube.year_list()
+        first_year = int_parameter(query, 'from', years.min(initial=0))
+        last_year = int_parameter(query, 'to', years.max(initial=0))
+        year_positions = np.flatnonzero((years >= first_year) & (years <= last_year))
+        regions = list_parameter(query, 'region')
+        region_positions = [cube.regions[x] for x in regions if x in cube.regions] if regions else range(len(cube.regions))
+        region_names = cube.region_list()
+
+        values = cube.values[np.ix_(year_positions, region_positions, [cube.metrics.index(x) for x in metrics])]
+        rows, columns = np.nonzero(~np.isnan(values).all(axis=2))
+        offset, limit = page(query, len(rows))
+        items = []
+        for row, column in zip(rows[offset:offset + limit].tolist(), columns[offset:offset + limit].tolist()):
+            item = {'year': int(years[year_positions[row]]), 'region': region_names[region_positions[column]]}
+            item.update((x, v) for x, v in zip(metrics, values[row, column].tolist()) if not np.isnan(v))
+            items.append(item)
+        return paginated(path, query, items, len(rows), offset, limit)
+
+    def respond(self, method, target, headers: dict[str, str]) -> tuple[HTTPStatus, dict[str, str], bytes]:
+        if method not in ('GET', 'HEAD'):
+            return error_response(HTTPStatus.METHOD_NOT_ALLOWED, 'méthode non permise', {'Allow': 'GET, HEAD'})
+        url = parse.urlsplit(target)
+        route = self.routes.get(url.path.rstrip('/') or '/')
+        if route is None:
+            return error_response(HTTPStatus.NOT_FOUND, 'chemin inconnu')
+        dataset, handler = route
+        if dataset is None:
+            versions = {x.name: x.current[0] if x.current else None for x in self.datasets}
+            version, index = '/'.join(x or '' for x in versions.values()), versions
+        elif dataset.current is None:
+            return error_response(HTTPStatus.SERVICE_UNAVAILABLE, '{} non disponible'.format(dataset.name))
+        else:
+            version, index = dataset.current
+
+        # L'étiquette dépend de la version des données et de la requête: une requête répétée est validée sans
+        # être exécutée de nouveau
+        query = parse.parse_qs(url.query)
+        canonical = json.dumps([url.path, sorted(query.items())])
+        etag = '{}-{}'.format(version, hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16])
+        compressed = 'gzip' in headers.get('accept-encoding', '')
+        response_headers = {
+            'Content-Type': 'application/json; charset=utf-8',
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+            'Access-Control-Allow-Origin': '*'
+        }
+        matches = {x.strip().removeprefix('W/') for x in headers.get('if-none-match', '').split(',')}
+        if '"{}"'.format(etag) in matches or '"{}-gzip"'.format(etag) in matches or '*' in matches:
+            response_headers['ETag'] = '"{}{}"'.format(etag, '-gzip' if compressed else '')
+            return HTTPStatus.NOT_MODIFIED, response_headers, b''
+
+        try:
+            body = json.dumps(handler(index, url.path, query), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        except QueryError as e:
+            return error_response(HTTPStatus.BAD_REQUEST, str(e))
+        if compressed and len(body) >= MIN_COMPRESSED_SIZE:
+            body = gzip.compress(body, compresslevel=6)
+            response_headers['Content-Encoding'] = 'gzip'
+            response_headers['ETag'] = '"{}-gzip"'.format(etag)
+        else:
+            response_headers['ETag'] = '"{}"'.format(etag)
+        return HTTPStatus.OK, response_headers, body
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await write_response(writer, 'GET', *error_response(HTTPStatus.BAD_REQUEST, 'requête invalide'),
+                                         keep_alive=False)
+                    break
+                # Aucune requête n'a de contenu, il est ignoré
+                length = int(headers.get('content-length', '0') or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await write_response(writer, method, *self.respond(method, target, headers), keep_alive=keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def error_response(status: HTTPStatus, message, headers=None) -> tuple[HTTPStatus, dict[str, str], bytes]:
+    body = json.dumps({'error': message}, ensure_ascii=False).encode('utf-8')
+    return status, {'Content-Type': 'application/json; charset=utf-8', **(headers or {})}, body
+
+
+async def write_response(writer: asyncio.StreamWriter, method, status: HTTPStatus, headers: dict[str, str], body: bytes,
+                         keep_alive=True):
+    lines = ['HTTP/1.1 {} {}'.format(status.value, status.phrase)]
+    lines += ['{}: {}'.format(k, v) for k, v in headers.items()]
+    if status != HTTPStatus.NOT_MODIFIED:
+        lines.append('Content-Length: {}'.format(len(body)))
+    lines.append('Connection: {}'.format('keep-alive' if keep_alive else 'close'))
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    if method != 'HEAD':
+        writer.write(body)
+    await writer.drain()
+
+
+async def serve(host, port, service: QueryService):
+    await asyncio.to_thread(service.load)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print('http://{}:{}'.format(host, port), file=sys.stderr)
+    async with server:
+        await asyncio.gather(server.serve_forever(), service.watch())
+
+
+if __name__ == '__main__':
+    options = dict((x[2:].split('=', 1) + [''])[:2] for x in sys.argv[1:] if x.startswith('--'))
+    try:
+        asyncio.run(serve(options.get('host', DEFAULT_HOST), int(options.get('port', DEFAULT_PORT)), QueryService()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,158 @@
+import csv
+import json
+import os
+from concurrent import futures
+from datetime import datetime
+import numpy as np
+from scipy.spatial import cKDTree
+from shapely import geometry
+from shapely import prepared
+import utils
+import climate_archive
+import climate_stations
+
+# Indicateur -> (fichier écrit dans data/, titre de la première colonne)
+INDICATORS = {
+    'avg_temp': ('temperatures_moy_stations', 'Températures moyennes en degré celcius'),
+    'avg_prec': ('precipitations_moy_stations', 'Précipitations totales en mm'),
+    'days_above_30': ('nb_jours_plus_30_deg_stations', 'Nombre de jours >30 °C'),
+    'days_below_min_25': ('nb_jours_moins_25_deg_stations', 'Nombre de jours <-25 °C'),
+}
+# Part minimale des jours de l'année ayant une lecture pour que l'indicateur de la station soit retenu
+MIN_COVERAGE = 0.9
+# Stations les plus proches utilisées pour chaque point et puissance de la pondération par l'inverse de la distance
+NEIGHBOURS = 8
+IDW_POWER = 2
+# Points échantillonnés dans chaque circonscription, sur une grille SAMPLE_GRID × SAMPLE_GRID
+SAMPLE_GRID = 5
+EARTH_RADIUS = 6371.0
+
+
+def station_years() -> np.ndarray:
+    return np.arange(utils.MIN_YEAR, datetime.now().year + 1)
+
+
+def yearly_indicators(days: np.ndarray, data: dict[str, np.ndarray], years: np.ndarray) -> np.ndarray:
+    # Indicateurs de chaque année (année × indicateur), NaN si la couverture de l'année est insuffisante
+    day_years = np.asarray(days).astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+    kept = (day_years >= years[0]) & (day_years <= years[-1])
+    index = day_years[kept] - years[0]
+    leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+    days_in_year = np.where(leap, 366, 365)
+    minimum = days_in_year * MIN_COVERAGE
+
+    def per_year(values, reduce):
+        values = np.asarray(values)[kept].astype(np.float64)
+        present = ~np.isnan(values)
+        counts = np.bincount(index, weights=present, minlength=len(years))
+        result = reduce(np.where(present, values, 0), counts)
+        return np.where(counts >= minimum, result, np.nan)
+
+    def whole_year(weights, n):
+        # Total des jours lus ramené à l'année entière, sinon il serait sous-estimé des jours manquants
+        return np.bincount(index, weights=weights, minlength=len(years)) * days_in_year / n
+
+    # Une lecture absente vaut 0: elle n'est comptée dans aucun des deux seuils
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.stack([
+            per_year(data['mean_temp'], lambda x, n: np.bincount(index, weights=x, minlength=len(years)) / n),
+            per_year(data['total_precip'], whole_year),
+            per_year(data['max_temp'], lambda x, n: whole_year(x > 30, n)),
+            per_year(data['min_temp'], lambda x, n: whole_year(x < -25, n)),
+        ], axis=1)
+
+
+def station_indicators(archive_directory, station_id, years) -> np.ndarray:
+    archive = climate_archive.ClimateArchive(archive_directory)
+    data = archive.load(station_id)
+    return yearly_indicators(data['date'], data, years)
+
+
+def to_xyz(locations: np.ndarray) -> np.ndarray:
+    # Coordonnées sur la sphère en km: la distance euclidienne suit la distance réelle entre deux points proches
+    lng, lat = np.radians(locations[:, 0]), np.radians(locations[:, 1])
+    return EARTH_RADIUS * np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=1)
+
+
+def sample_points(shape: geometry.base.BaseGeometry) -> list[tuple[float, float]]:
+    # Point représentatif et points d'une grille sur l'étendue de la circonscription qui y sont contenus
+    # Les GeometryCollection sont aplaties, comme dans utils.DistrictLocator
+    parts = list(utils.flatten_geometry(shape))
+    points = [max(parts, key=lambda x: x.area).representative_point().coords[0]]
+    contained = [prepared.prep(x) for x in parts]
+    min_x, min_y, max_x, max_y = shape.bounds
+    for x in np.linspace(min_x, max_x, SAMPLE_GRID + 2)[1:-1]:
+        for y in np.linspace(min_y, max_y, SAMPLE_GRID + 2)[1:-1]:
+            point = geometry.Point(x, y)
+            if any(part.contains(point) for part in contained):
+                points.append((x, y))
+    return points
+
+
+def district_indicators(station_locations: np.ndarray, values: np.ndarray,
+                        district_shapes: dict[int, geometry.base.BaseGeometry]) -> tuple[list[int], np.ndarray]:
+    # values: station × année × indicateur. Chaque point échantillonné reçoit la moyenne de ses stations voisines
+    # pondérée par l'inverse de la distance, puis les points sont moyennés par circonscription. Une circonscription
+    # sans station sur son territoire reçoit ainsi la valeur interpolée de ses voisines
+    ids = list(district_shapes)
+    samples = [sample_points(district_shapes[x]) for x in ids]
+    offsets = np.cumsum([0] + [len(x) for x in samples[:-1]])
+    points = np.array([point for points in samples for point in points])
+
+    tree = cKDTree(to_xyz(station_locations))
+    k = min(NEIGHBOURS, len(station_locations))
+    distances, neighbours = tree.query(to_xyz(points), k=k)
+    distances = distances.reshape(len(points), k)
+    neighbours = neighbours.reshape(len(points), k)
+
+    weights = 1 / np.maximum(distances, 1e-3) ** IDW_POWER
+    nearby = values[neighbours]
+    present = ~np.isnan(nearby)
+    weights = np.where(present, weights[:, :, np.newaxis, np.newaxis], 0)
+    total = weights.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        estimates = (np.where(present, nearby, 0) * weights).sum(axis=1) / total
+        estimated = total > 0
+        sums = np.add.reduceat(np.where(estimated, estimates, 0), offsets, axis=0)
+        counts = np.add.reduceat(estimated.astype(np.int64), offsets, axis=0)
+        return ids, np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def station_values(executor: futures.Executor, archive_directory, station_ids: list[str], years: np.ndarray) -> np.ndarray:
+    # Indicateurs des stations (station × année × indicateur), répartis entre les processus de l'executor
+    return np.stack(list(executor.map(station_indicators, [archive_directory] * len(station_ids), station_ids,
+                                      [years] * len(station_ids), chunksize=16)))
+
+
+def write_district_indicators(locations: np.ndarray, values: np.ndarray, years: np.ndarray, destination,
+                              map_path=None, names_path=None):
+    # Exécutable dans un autre processus: seule la carte de la province y est chargée
+    ids, result = district_indicators(locations, values, utils.load_map(map_path))
+
+    with open(names_path or utils.district_names_path(), 'r', encoding='utf-8') as input_file:
+        names = json.load(input_file)
+    for i, (file_name, title) in enumerate(INDICATORS.values()):
+        with open(os.path.join(destination, '{}.csv'.format(file_name)), 'w', encoding='utf-8', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow([title] + ['{} - {}'.format(x, names.get(str(x), '')) for x in ids])
+            for year, row in zip(years.tolist(), result[:, :, i].T.tolist()):
+                if not all(np.isnan(row)):
+                    writer.writerow([year] + ['' if np.isnan(x) else '{:.3f}'.format(x) for x in row])
+
+
+def write_indicators(stations: dict[str, dict], archive_directory=climate_archive.archive_directory,
+                     destination=utils.source_directory, processes=None, map_path=None, names_path=None):
+    archive = climate_archive.ClimateArchive(archive_directory)
+    station_ids = [x for x in stations if x in archive]
+    if not station_ids:
+        return
+    years = station_years()
+    with futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        values = station_values(executor, archive_directory, station_ids, years)
+    locations = np.array([stations[x]['loc'] for x in station_ids], dtype=np.float64)
+    write_district_indicators(locations, values, years, destination, map_path, names_path)
+
+
+if __name__ == '__main__':
+    # Recalcule les indicateurs à partir de l'archive existante, sans rien télécharger
+    write_indicators(climate_stations.load_stations())
@@ -0,0 +1,226 @@
+from shapely import geometry
+from shapely import validation
+import utils
+
+WORLD = [(-180, -180), (-180, 180), (180, 180), (180, -180), (-180, -180)]
+
+
+def polygon_parts(shape: geometry.base.BaseGeometry) -> list[geometry.Polygon]:
+    polygons = []
+    for part in utils.flatten_geometry(shape):
+        if isinstance(part, geometry.Polygon):
+            polygons.append(part)
+        elif isinstance(part, geometry.MultiPolygon):
+            polygons.extend(part.geoms)
+    return polygons
+
+
+def simplify_line(points: list[tuple[float, float]], tolerance: float) -> list[int]:
+    # Douglas-Peucker itératif, retourne les index des points conservés
+    keep = {0, len(points) - 1}
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        (x1, y1), (x2, y2) = points[start], points[end]
+        dx, dy = x2 - x1, y2 - y1
+        length = (dx * dx + dy * dy) ** 0.5
+        farthest = None
+        max_distance = tolerance
+        for i in range(start + 1, end):
+            px, py = points[i]
+            if length:
+                distance = abs(dy * px - dx * py + x2 * y1 - y2 * x1) / length
+            else:
+                distance = ((px - x1) ** 2 + (py - y1) ** 2) ** 0.5
+            if distance > max_distance:
+                farthest = i
+                max_distance = distance
+        if farthest is not None:
+            keep.add(farthest)
+            stack.append((start, farthest))
+            stack.append((farthest, end))
+    return sorted(keep)
+
+
+class Topology:
+    def __init__(self, shapes: list[geometry.base.BaseGeometry], quantization=100000):
+        polygons = [polygon_parts(x) for x in shapes]
+        bounds = [x.bounds for parts in polygons for x in parts]
+        x0, y0 = min(x[0] for x in bounds), min(x[1] for x in bounds)
+        x1, y1 = max(x[2] for x in bounds), max(x[3] for x in bounds)
+        self.bbox = [x0, y0, x1, y1]
+        self.scale = [(x1 - x0) / (quantization - 1) or 1, (y1 - y0) / (quantization - 1) or 1]
+        self.translate = [x0, y0]
+
+        self.arcs: list[list[tuple[int, int]]] = []
+        self._arc_index: dict[tuple, int] = {}
+
+        rings = [[[self._quantize_ring(ring.coords) for ring in [polygon.exterior, *polygon.interiors]]
+                  for polygon in parts] for parts in polygons]
+        junctions = self._find_junctions(x for parts in rings for polygon in parts for x in polygon if x)
+        # Pour chaque forme: liste de polygones, chaque polygone une liste d'anneaux, chaque anneau une liste d'arcs
+        self.geometries = [[[self._cut_ring(x, junctions) for x in polygon if x] for polygon in parts if polygon and polygon[0]]
+                           for parts in rings]
+
+    def quantize(self, x, y) -> tuple[int, int]:
+        return (round((x - self.translate[0]) / self.scale[0]), round((y - self.translate[1]) / self.scale[1]))
+
+    def dequantize(self, point) -> tuple[float, float]:
+        return (point[0] * self.scale[0] + self.translate[0], point[1] * self.scale[1] + self.translate[1])
+
+    def _quantize_ring(self, coords) -> list[tuple[int, int]]:
+        ring = []
+        for x, y, *_ in coords:
+            point = self.quantize(x, y)
+            if not ring or ring[-1] != point:
+                ring.append(point)
+        if ring and ring[0] == ring[-1]:
+            ring.pop()
+        # Anneau dégénéré après quantification
+        return ring if len(ring) >= 3 else []
+
+    @staticmethod
+    def _find_junctions(rings) -> set[tuple[int, int]]:
+        neighbours = {}
+        junctions = set()
+        for ring in rings:
+            count = len(ring)
+            for i, point in enumerate(ring):
+                pair = tuple(sorted((ring[i - 1], ring[(i + 1) % count])))
+                previous = neighbours.setdefault(point, pair)
+                if previous != pair:
+                    junctions.add(point)
+        return junctions
+
+    def _add_arc(self, arc: list[tuple[int, int]]) -> int:
+        key = tuple(arc)
+        if key in self._arc_index:
+            return self._arc_index[key]
+        reverse_key = tuple(reversed(arc))
+        if reverse_key in self._arc_index:
+            return ~self._arc_index[reverse_key]
+        self._arc_index[key] = len(self.arcs)
+        self.arcs.append(arc)
+        return len(self.arcs) - 1
+
+    def _cut_ring(self, ring: list[tuple[int, int]], junctions: set) -> list[int]:
+        starts = [i for i, x in enumerate(ring) if x in junctions]
+        if not starts:
+            # Anneau sans voisin: arc fermé, normalisé pour être partagé dans les deux sens
+            start = ring.index(min(ring))
+            forward = ring[start:] + ring[:start]
+            return [self._add_arc(forward + [forward[0]])]
+
+        rotated = ring[starts[0]:] + ring[:starts[0]] + [ring[starts[0]]]
+        arcs = []
+        current = [rotated[0]]
+        for point in rotated[1:]:
+            current.append(point)
+            if point in junctions:
+                arcs.append(self._add_arc(current))
+                current = [point]
+        return arcs
+
+    def arc_usage(self) -> dict[int, int]:
+        usage = {}
+        for parts in self.geometries:
+            for polygon in parts:
+                for ring in polygon:
+                    for arc in ring:
+                        index = arc if arc >= 0 else ~arc
+                        usage[index] = usage.get(index, 0) + 1
+        return usage
+
+    def outline(self) -> list[list[int]]:
+        # Assemble les arcs utilisés par une seule forme en anneaux, puis garde les anneaux extérieurs
+        free = {x for x, count in self.arc_usage().items() if count == 1}
+        by_point: dict[tuple[int, int], list[int]] = {}
+        for index in free:
+            arc = self.arcs[index]
+            by_point.setdefault(arc[0], []).append(index)
+            by_point.setdefault(arc[-1], []).append(index)
+
+        rings = []
+        while free:
+            first = free.pop()
+            ring = [first]
+            start = self.arcs[first][0]
+            end = self.arcs[first][-1]
+            while end != start:
+                following = next((x for x in by_point[end] if x in free), None)
+                if following is None:
+                    break
+                free.discard(following)
+                if self.arcs[following][0] == end:
+                    ring.append(following)
+                    end = self.arcs[following][-1]
+                else:
+                    ring.append(~following)
+                    end = self.arcs[following][0]
+            if end == start:
+                rings.append(ring)
+
+        shapes = [validation.make_valid(geometry.Polygon(self._ring_points(x))) for x in rings]
+        return [ring for i, ring in enumerate(rings)
+                if shapes[i].area and not any(j != i and shapes[j].contains(shapes[i]) for j in range(len(rings)))]
+
+    def _ring_points(self, ring: list[int]) -> list[tuple[float, float]]:
+        points = []
+        for arc in ring:
+            coords = self.arcs[arc] if arc >= 0 else list(reversed(self.arcs[~arc]))
+            points.extend(self.dequantize(x) for x in (coords if not points else coords[1:]))
+        return points
+
+    def simplified_arcs(self, tolerance: float) -> list[list[tuple[int, int]]]:
+        if not tolerance:
+            return self.arcs
+        result = []
+        for arc in self.arcs:
+            points = [self.dequantize(x) for x in arc]
+            if arc[0] == arc[-1]:
+                # Arc fermé: on le coupe au point le plus éloigné pour conserver sa forme
+                far = max(range(len(points)), key=lambda i: (points[i][0] - points[0][0]) ** 2 + (points[i][1] - points[0][1]) ** 2)
+                kept = simplify_line(points[:far + 1], tolerance) + [far + x for x in simplify_line(points[far:], tolerance)[1:]]
+                if len(kept) < 4:
+                    kept = list(range(len(arc)))
+            else:
+                kept = simplify_line(points, tolerance)
+            result.append([arc[i] for i in kept])
+        return result
+
+    def to_json(self, properties: list[dict], tolerance=0.0, mask=True) -> dict:
+        arcs = [list(x) for x in self.simplified_arcs(tolerance)]
+        geometries = []
+        for parts, props in zip(self.geometries, properties):
+            if len(parts) == 1:
+                geometries.append({'type': 'Polygon', 'arcs': parts[0], 'properties': props})
+            elif parts:
+                geometries.append({'type': 'MultiPolygon', 'arcs': parts, 'properties': props})
+            else:
+                geometries.append({'type': None, 'properties': props})
+
+        objects = {'districts': {'type': 'GeometryCollection', 'geometries': geometries}}
+        if mask:
+            world = len(arcs)
+            arcs.append([self.quantize(x, y) for x, y in WORLD])
+            objects['mask'] = {'type': 'Polygon', 'arcs': [[world]] + self.outline()}
+
+        encoded = []
+        for arc in arcs:
+            # Coordonnées en deltas, sauf la première
+            previous = (0, 0)
+            delta = []
+            for point in arc:
+                delta.append([point[0] - previous[0], point[1] - previous[1]])
+                previous = point
+            encoded.append(delta)
+
+        return {
+            'type': 'Topology',
+            'bbox': self.bbox,
+            'transform': {'scale': self.scale, 'translate': self.translate},
+            'objects': objects,
+            'arcs': encoded
+        }
@@ -4,62 +4,118 @@ import json
 import kml2geojson
 import csv
 import utils
+import instrumentation
 import geojson
 import geojson.mapping
 from shapely import ops
 from shapely import geometry
 from shapely import validation
+from shapely import wkb
 import copy
+import topology
 
-result = kml2geojson.main.convert(path.join(
-    utils.source_directory, 'carte_simple.kml'), 'carte_electorale')[0]
+# Niveaux de simplification servis selon le zoom de la carte (tolérance en degrés)
+MAP_LEVELS = [
+    {'name': 'low', 'min_zoom': 0, 'max_zoom': 7, 'tolerance': 0.005},
+    {'name': 'medium', 'min_zoom': 8, 'max_zoom': 9, 'tolerance': 0.001},
+    {'name': 'high', 'min_zoom': 10, 'max_zoom': None, 'tolerance': 0},
+]
 
-with open(path.join(utils.source_directory, 'liste_circonscriptions.csv'), 'r', encoding='utf-8') as input_file:
-    reader = csv.reader(input_file, delimiter=';')
-    next(reader, None)
-    districts = {x[1]: int(x[0]) for x in reader}
+def convert_map():
+    with instrumentation.stage('kml2geojson'):
+        result = kml2geojson.main.convert(kml_path, 'carte_electorale')[0]
 
-for feature in result['features']:
-    properties = feature['properties']
-    properties['name'] = properties['name'].strip()
-    properties['id'] = districts[properties['name']]
+    with open(districts_path, 'r', encoding='utf-8') as input_file:
+        reader = csv.reader(input_file, delimiter=';')
+        next(reader, None)
+        districts = {x[1]: int(x[0]) for x in reader}
 
-ungava_index = next(i for i, v in enumerate(result['features']) if v['properties']['id'] == utils.UNGAVA_ID)
-ungava_shape = geometry.shape(result['features'][ungava_index]['geometry'])
-[north_geo, south_geo] = ops.split(ungava_shape, geometry.LineString([(-180, 55), (180, 55)])).geoms
+    for feature in result['features']:
+        properties = feature['properties']
+        properties['name'] = properties['name'].strip()
+        properties['id'] = districts[properties['name']]
 
-ungava_north = result['features'][ungava_index]
-ungava_south = copy.deepcopy(ungava_north)
-result['features'].insert(ungava_index, ungava_south)
+    ungava_index = next(i for i, v in enumerate(result['features']) if v['properties']['id'] == utils.UNGAVA_ID)
+    ungava_shape = geometry.shape(result['features'][ungava_index]['geometry'])
+    [north_geo, south_geo] = ops.split(ungava_shape, geometry.LineString([(-180, 55), (180, 55)])).geoms
 
-ungava_north['geometry'] = geojson.mapping.to_mapping(north_geo)
-ungava_north['properties']['name'] = 'Ungava (Nunavik)'
-ungava_south['geometry'] = geojson.mapping.to_mapping(south_geo)
-ungava_south['properties']['name'] = 'Ungava (Jamésie)'
-ungava_south['properties']['id'] = ungava_north['properties']['id'] + 1
+    ungava_north = result['features'][ungava_index]
+    ungava_south = copy.deepcopy(ungava_north)
+    result['features'].insert(ungava_index, ungava_south)
 
-district_map = {str(id): name for name, id in districts.items()}
-district_map[str(ungava_north['properties']['id'])] = ungava_north['properties']['name']
-district_map[str(ungava_south['properties']['id'])] = ungava_south['properties']['name']
+    ungava_north['geometry'] = geojson.mapping.to_mapping(north_geo)
+    ungava_north['properties']['name'] = 'Ungava (Nunavik)'
+    ungava_south['geometry'] = geojson.mapping.to_mapping(south_geo)
+    ungava_south['properties']['name'] = 'Ungava (Jamésie)'
+    ungava_south['properties']['id'] = ungava_north['properties']['id'] + 1
 
-polygons = []
-for feature in result['features']:
-    polygon = validation.make_valid(geometry.shape(feature['geometry']))
-    feature['bbox'] = polygon.bounds
-    feature['geometry'] = geojson.mapping.to_mapping(polygon)
-    polygons.append(polygon)
+    district_map = {str(id): name for name, id in districts.items()}
+    district_map[str(ungava_north['properties']['id'])] = ungava_north['properties']['name']
+    district_map[str(ungava_south['properties']['id'])] = ungava_south['properties']['name']
 
+    polygons = []
+    with instrumentation.stage('make_valid') as stage:
+        for feature in result['features']:
+            polygon = validation.make_valid(geometry.shape(feature['geometry']))
+            feature['bbox'] = polygon.bounds
+            feature['geometry'] = geojson.mapping.to_mapping(polygon)
+            polygons.append(polygon)
+            stage.count('rows_read')
+    return result, district_map, polygons
+
+
+kml_path = path.join(utils.source_directory, 'carte_simple.kml')
+districts_path = path.join(utils.source_directory, 'liste_circonscriptions.csv')
 EPSILON = 0.000001
-merged = ops.unary_union(polygons)
-merged = geometry.Polygon(merged.exterior)
-merged = merged.buffer(EPSILON, 1, join_style=geometry.JOIN_STYLE.mitre).buffer(-EPSILON, 1, join_style=geometry.JOIN_STYLE.mitre)
-
-world = geometry.Polygon([(-180, -180), (-180, 180), (180, 180), (180, -180)])
-box = world.difference(merged)
-
-with open(path.join(utils.destination_directory, '..', '..', 'src', 'models', 'districts.json'), 'w', encoding='utf-8') as output_file:
-    json.dump(district_map, output_file)
-with open(path.join(utils.destination_directory, 'carte_electorale.json'), 'w', encoding='utf-8') as output_file:
-    json.dump(result, output_file)
-with open(path.join(utils.destination_directory, 'masque_electoral.json'), 'w', encoding='utf-8') as output_file:
-    geojson.dump(box, output_file)
+
+
+def build_mask(polygons) -> geometry.base.BaseGeometry:
+    # Contour extérieur de l'union des circonscriptions, soustrait du monde entier
+    with instrumentation.stage('unary_union') as stage:
+        stage.count('rows_read', len(polygons))
+        merged = ops.unary_union(polygons)
+    merged = geometry.Polygon(merged.exterior)
+    merged = merged.buffer(EPSILON, 1, join_style=geometry.JOIN_STYLE.mitre).buffer(-EPSILON, 1, join_style=geometry.JOIN_STYLE.mitre)
+
+    world = geometry.Polygon([(-180, -180), (-180, 180), (180, 180), (180, -180)])
+    return world.difference(merged)
+
+
+if __name__ == '__main__':
+    with instrumentation.run('update_map'):
+        # La conversion KML et la validation des polygones ne sont refaites que si les sources changent
+        source_key = utils.file_hash(kml_path, districts_path, path.realpath(__file__))
+        cached = utils.read_cache('carte_simple', source_key)
+        if cached is None:
+            result, district_map, polygons = convert_map()
+            utils.write_cache('carte_simple', source_key, (result, district_map, [x.wkb for x in polygons]))
+        else:
+            result, district_map, polygon_data = cached
+            polygons = [wkb.loads(x) for x in polygon_data]
+
+        box = build_mask(polygons)
+
+        with instrumentation.stage('write_map') as stage:
+            with open(path.join(utils.destination_directory, '..', '..', 'src', 'models', 'districts.json'), 'w', encoding='utf-8') as output_file:
+                json.dump(district_map, output_file)
+                stage.count('bytes_written', output_file.tell())
+            with open(path.join(utils.destination_directory, 'carte_electorale.json'), 'w', encoding='utf-8') as output_file:
+                json.dump(result, output_file)
+                stage.count('bytes_written', output_file.tell())
+            with open(path.join(utils.destination_directory, 'masque_electoral.json'), 'w', encoding='utf-8') as output_file:
+                geojson.dump(box, output_file)
+                stage.count('bytes_written', output_file.tell())
+
+        # Carte en topologie partagée (TopoJSON) quantifiée, un fichier par niveau de simplification
+        with instrumentation.stage('topology') as stage:
+            topo = topology.Topology(polygons)
+            properties = [{'id': x['properties']['id'], 'name': x['properties']['name']} for x in result['features']]
+            levels = []
+            for level in MAP_LEVELS:
+                file_name = 'carte_electorale_{}.topo.json'.format(level['name'])
+                with open(path.join(utils.destination_directory, file_name), 'w', encoding='utf-8') as output_file:
+                    json.dump(topo.to_json(properties, level['tolerance']), output_file, separators=(',', ':'))
+                    stage.count('bytes_written', output_file.tell())
+                levels.append({'name': level['name'], 'min_zoom': level['min_zoom'], 'max_zoom': level['max_zoom'], 'file': file_name})
+        with open(path.join(utils.destination_directory, 'carte_electorale_niveaux.json'), 'w', encoding='utf-8') as output_file:
+            json.dump(levels, output_file)
@@ -1,5 +1,17 @@
 from os import path
+import csv
+import json
+import hashlib
+import os
+import pickle
+import string
+import unicodedata
+import warnings
 from shapely import geometry
+from shapely import prepared
+from shapely import wkb
+from shapely.errors import ShapelyDeprecationWarning
+from shapely.strtree import STRtree
 import geojson
 
 UNGAVA_ID = 938
@@ -8,9 +20,92 @@ MIN_YEAR = 1990
 current_directory = path.dirname(path.realpath(__file__))
 source_directory = path.realpath(path.join(current_directory, 'data'))
 destination_directory = path.realpath(path.join(current_directory, '..', 'public', 'data'))
+cache_directory = path.join(current_directory, '.cache')
 
-def load_map() -> dict[int, geometry.base.BaseGeometry]:
-    with open(path.join(destination_directory, 'carte_electorale.json'), 'r', encoding='utf-8') as input_file:
+# Code des URL de données climatiques -> nom de la province dans la liste des stations
+PROVINCES = {
+    'QC': 'QUEBEC', 'ON': 'ONTARIO', 'BC': 'BRITISH COLUMBIA', 'AB': 'ALBERTA', 'SK': 'SASKATCHEWAN',
+    'MB': 'MANITOBA', 'NB': 'NEW BRUNSWICK', 'NS': 'NOVA SCOTIA', 'PE': 'PRINCE EDWARD ISLAND',
+    'NL': 'NEWFOUNDLAND', 'YT': 'YUKON TERRITORY', 'NT': 'NORTHWEST TERRITORIES', 'NU': 'NUNAVUT'
+}
+DEFAULT_PROVINCE = 'QC'
+
+def province_directories(code) -> tuple[str, str, str]:
+    # Répertoires de données, de sortie et de cache d'une province. Le Québec garde les répertoires d'origine, les
+    # autres provinces ont les leurs, de même structure, dans provinces/<code>
+    if code == DEFAULT_PROVINCE:
+        return source_directory, destination_directory, cache_directory
+    return tuple(path.join(x, 'provinces', code) for x in (source_directory, destination_directory, cache_directory))
+
+def parse_province(argv: list[str]) -> str:
+    # Option --province=XX des scripts de génération, le Québec par défaut
+    code = DEFAULT_PROVINCE
+    for x in argv:
+        if x.startswith('--province='):
+            code = x.split('=', 1)[1].upper()
+    if code not in PROVINCES:
+        raise ValueError('Province inconnue: {}'.format(code))
+    return code
+
+def parse_provinces(value: str) -> list[str]:
+    # 'all' ou des codes séparés par des virgules, ex.: QC,ON
+    codes = list(PROVINCES) if value == 'all' else [x.strip().upper() for x in value.split(',') if x.strip()]
+    unknown = [x for x in codes if x not in PROVINCES]
+    if unknown:
+        raise ValueError('Provinces inconnues: {}'.format(', '.join(unknown)))
+    return codes
+
+def map_path(code=DEFAULT_PROVINCE) -> str:
+    return path.join(province_directories(code)[1], 'carte_electorale.json')
+
+def district_names_path(code=DEFAULT_PROVINCE) -> str:
+    # Le site du Québec importe les noms des circonscriptions depuis src/models, les autres provinces les ont à côté
+    # de leur carte
+    destination = province_directories(code)[1]
+    if code == DEFAULT_PROVINCE:
+        return path.join(destination, '..', '..', 'src', 'models', 'districts.json')
+    return path.join(destination, 'districts.json')
+
+def normalize_name(name: str) -> str:
+    return ''.join(x for x in unicodedata.normalize(
+        'NFKD', name) if x in string.ascii_letters).replace('-', ' ').lower()
+
+def file_hash(*paths) -> str:
+    digest = hashlib.sha256()
+    for file_path in paths:
+        with open(file_path, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def read_cache(name, key):
+    try:
+        with open(path.join(cache_directory, '{}.pickle'.format(name)), 'rb') as input_file:
+            cached_key, value = pickle.load(input_file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    return value if cached_key == key else None
+
+def write_cache(name, key, value):
+    os.makedirs(cache_directory, exist_ok=True)
+    cache_path = path.join(cache_directory, '{}.pickle'.format(name))
+    # Fichier temporaire propre au processus: plusieurs processus peuvent écrire la même entrée
+    temporary_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    with open(temporary_path, 'wb') as output_file:
+        pickle.dump((key, value), output_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, cache_path)
+
+def load_map(map_path=None) -> dict[int, geometry.base.BaseGeometry]:
+    if map_path is None:
+        map_path = path.join(destination_directory, 'carte_electorale.json')
+    # Les géométries sont mises en cache en WKB tant que la carte ne change pas, une entrée par carte
+    key = file_hash(map_path)
+    cache_name = 'carte_electorale_' + hashlib.sha256(path.realpath(map_path).encode('utf-8')).hexdigest()[:12]
+    cached = read_cache(cache_name, key)
+    if cached is not None:
+        return {id: wkb.loads(data) for id, data in cached}
+
+    with open(map_path, 'r', encoding='utf-8') as input_file:
         map = geojson.load(input_file)
 
     districts = {}
@@ -18,6 +113,7 @@ def load_map() -> dict[int, geometry.base.BaseGeometry]:
         shape = geometry.shape(feature['geometry'])
         id = feature['properties']['id']
         districts[id] = shape
+    write_cache(cache_name, key, [(id, shape.wkb) for id, shape in districts.items()])
     return districts
 
 def contains_point(geo: geometry.base.BaseGeometry, pt: geometry.Point) -> bool:
@@ -34,3 +130,148 @@ def find_district(district_shapes, location):
         if contains_point(shape, pt):
             return id
     return None
+
+def flatten_geometry(geo: geometry.base.BaseGeometry):
+    if isinstance(geo, geometry.GeometryCollection):
+        for sub in geo.geoms:
+            yield from flatten_geometry(sub)
+    elif not geo.is_empty:
+        yield geo
+
+
+class DistrictLocator:
+    def __init__(self, district_shapes: dict[int, geometry.base.BaseGeometry] = None):
+        if district_shapes is None:
+            district_shapes = load_map()
+
+        # Les GeometryCollection sont aplaties pour que chaque partie soit indexée séparément
+        parts = []
+        self._ids = []
+        for id, shape in district_shapes.items():
+            for part in flatten_geometry(shape):
+                parts.append(part)
+                self._ids.append(id)
+        self._prepared = [prepared.prep(x) for x in parts]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', ShapelyDeprecationWarning)
+            self._tree = STRtree(parts)
+        self._cache: dict[tuple[float, float], int | None] = {}
+
+    def locate(self, location) -> int | None:
+        key = (float(location[0]), float(location[1]))
+        if key in self._cache:
+            return self._cache[key]
+
+        pt = geometry.Point(key)
+        district_id = None
+        # On conserve l'ordre de la carte pour que le résultat soit identique à find_district
+        for index in sorted(self._tree.query_items(pt)):
+            if self._prepared[index].contains(pt):
+                district_id = self._ids[index]
+                break
+        self._cache[key] = district_id
+        return district_id
+
+    def locate_all(self, locations) -> list[int | None]:
+        return [self.locate(x) for x in locations]
+
+
+class PrefixMatcher:
+    def __init__(self, names=()):
+        self._root = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str, value=None):
+        node = self._root
+        for char in normalize_name(name):
+            node = node.setdefault(char, {})
+        # En cas de doublon, le premier nom ajouté est conservé
+        node.setdefault(None, name if value is None else value)
+
+    def get(self, name: str, default=None):
+        node = self._root
+        for char in normalize_name(name):
+            node = node.get(char)
+            if node is None:
+                return default
+        return node.get(None, default)
+
+    def longest_prefix(self, text: str, default=None):
+        node = self._root
+        result = default
+        for char in normalize_name(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                result = node[None]
+        return result
+
+
+def load_municipalities() -> PrefixMatcher:
+    with open(path.join(source_directory, 'municipalites.csv'), 'r', encoding='utf-8') as input_file:
+        reader = csv.reader(input_file)
+        next(reader, None)
+        return PrefixMatcher(line[1] for line in reader)
+
+
+def iter_json_array(file_path, key, chunk_size=1 << 16):
+    # Lit un à un les éléments du tableau `key` d'un gros document JSON, sans charger tout le fichier. Seules les
+    # clés de l'objet racine sont considérées, les autres valeurs sont lues et ignorées
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as input_file:
+        buffer = ''
+        eof = False
+
+        def skip(characters):
+            # Retire les séparateurs en tête du tampon, en lisant la suite du fichier au besoin
+            nonlocal buffer, eof
+            buffer = buffer.lstrip(characters)
+            while not buffer and not eof:
+                chunk = input_file.read(chunk_size)
+                eof = not chunk
+                buffer = chunk.lstrip(characters)
+
+        def next_value():
+            # Une valeur qui touche la fin du tampon peut être coupée (ex.: un nombre), on lit alors la suite
+            nonlocal buffer, eof
+            skip(' \t\r\n')
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    end = None
+                if end is not None and (end < len(buffer) or eof):
+                    buffer = buffer[end:]
+                    return value
+                chunk = input_file.read(chunk_size)
+                eof = not chunk
+                buffer += chunk
+
+        def expect(character):
+            nonlocal buffer
+            skip(' \t\r\n')
+            if not buffer.startswith(character):
+                raise ValueError('{}: {} attendu'.format(file_path, character))
+            buffer = buffer[1:]
+
+        expect('{')
+        while True:
+            skip(' \t\r\n,')
+            if not buffer or buffer.startswith('}'):
+                raise ValueError('{}: clé {} absente'.format(file_path, key))
+            name = next_value()
+            expect(':')
+            if name == key:
+                break
+            next_value()
+        expect('[')
+
+        while True:
+            skip(' \t\r\n,')
+            if buffer.startswith(']'):
+                return
+            yield next_value()
@@ -1,9 +1,48 @@
 import { fileURLToPath, URL } from 'node:url'
 
-import { defineConfig } from 'vite'
+import { defineConfig, Plugin } from 'vite'
 import vue from '@vitejs/plugin-vue'
 import vueI18n from '@intlify/vite-plugin-vue-i18n'
 import path from 'path'
+import fs from 'fs'
+import zlib from 'zlib'
+
+// Writes .gz and .br siblings of the data files, served as is by nginx (gzip_static)
+function precompressData(directory: string, minLength = 512): Plugin {
+  let outDir = 'dist';
+  const compress = (folder: string) => {
+    for (const entry of fs.readdirSync(folder, { withFileTypes: true })) {
+      const file = path.join(folder, entry.name);
+      if (entry.isDirectory()) {
+        compress(file);
+      } else if (!/\.(gz|br)$/.test(entry.name)) {
+        const content = fs.readFileSync(file);
+        if (content.length >= minLength) {
+          fs.writeFileSync(file + '.gz', zlib.gzipSync(content, { level: 9 }));
+          fs.writeFileSync(file + '.br', zlib.brotliCompressSync(content, {
+            params: {
+              [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+              [zlib.constants.BROTLI_PARAM_SIZE_HINT]: content.length
+            }
+          }));
+        }
+      }
+    }
+  };
+  return {
+    name: 'precompress-data',
+    apply: 'build',
+    configResolved(config) {
+      outDir = path.resolve(config.root, config.build.outDir);
+    },
+    closeBundle() {
+      const folder = path.join(outDir, directory);
+      if (fs.existsSync(folder)) {
+        compress(folder);
+      }
+    }
+  };
+}
 
 // https://vitejs.dev/config/
 export default defineConfig({
@@ -12,7 +51,8 @@ export default defineConfig({
     vueI18n({
       runtimeOnly: false,
       include: path.resolve(__dirname, "./src/locales/**"),
-    })
+    }),
+    precompressData('data')
   ],
   resolve: {
     alias: {